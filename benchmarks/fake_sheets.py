@@ -0,0 +1,137 @@
+"""Local stand-in for the Google Sheets values.get and values:batchGet endpoints.
+
+Serves synthetic timetables (see synthetic.py) for any spreadsheet id, so
+the API can be pointed at it with SHEETS_API_ENDPOINT=http://127.0.0.1:<port>.
+Ranges in A1 notation are honoured and /_bench/stats counts the bytes served.
+
+    python benchmarks/fake_sheets.py --port 9100 --latency-ms 300
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+
+from aiohttp import web
+
+from synthetic import CLASSES_PER_SHEET, build_sheet_rows
+
+
+A1_CELLS = re.compile(r"^([A-Z]+)(\d+):([A-Z]+)(\d+)$")
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def slice_range(rows, value_range):
+    """Cut an A1 range ('Sheet'!B3:H200) out of the rows, trimming empty tails like Google does"""
+    cells = value_range.rsplit("!", 1)[-1]
+    match = A1_CELLS.match(cells)
+    if not match:
+        return rows
+    first_col, first_row, last_col, last_row = match.groups()
+    first_col, last_col = column_index(first_col), column_index(last_col)
+    values = []
+    for row in rows[int(first_row) - 1:int(last_row)]:
+        cells = row[first_col:last_col + 1]
+        while cells and cells[-1] == "":
+            cells.pop()
+        values.append(cells)
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+
+def build_app(latency_ms=0.0, error_ratio=0.0, classes_per_sheet=CLASSES_PER_SHEET):
+    versions = {}  # spreadsheet_id -> content version (bump bilan o'zgaradi)
+    sheets = {}    # (spreadsheet_id, version) -> rows
+    stats = {"requests": 0, "batch_requests": 0, "errors": 0, "bytes": 0}
+
+    def sheet_rows(sheet_id):
+        key = (sheet_id, versions.get(sheet_id, 0))
+        if key not in sheets:
+            sheets[key] = build_sheet_rows(sheet_id, classes_per_sheet, key[1])
+        return sheets[key]
+
+    async def upstream_delay():
+        """Latency and injected errors shared by both endpoints; returns an error response or None"""
+        stats["requests"] += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if error_ratio and random.random() < error_ratio:
+            stats["errors"] += 1
+            return web.json_response({"error": {"code": 503, "message": "Backend Error"}}, status=503)
+        return None
+
+    def respond(payload):
+        body = json.dumps(payload, ensure_ascii=False)
+        stats["bytes"] += len(body.encode("utf-8"))
+        return web.Response(text=body, content_type="application/json")
+
+    async def values_get(request):
+        error = await upstream_delay()
+        if error:
+            return error
+        value_range = request.match_info["range"]
+        return respond({
+            "range": value_range,
+            "majorDimension": "ROWS",
+            "values": slice_range(sheet_rows(request.match_info["spreadsheet_id"]), value_range),
+        })
+
+    async def values_batch_get(request):
+        error = await upstream_delay()
+        if error:
+            return error
+        stats["batch_requests"] += 1
+        sheet_id = request.match_info["spreadsheet_id"]
+        rows = sheet_rows(sheet_id)
+        return respond({
+            "spreadsheetId": sheet_id,
+            "valueRanges": [
+                {"range": value_range, "majorDimension": "ROWS", "values": slice_range(rows, value_range)}
+                for value_range in request.query.getall("ranges", [])
+            ],
+        })
+
+    async def bump(request):
+        """Change the content of one spreadsheet (next values.get returns new lessons)"""
+        sheet_id = request.match_info["spreadsheet_id"]
+        versions[sheet_id] = versions.get(sheet_id, 0) + 1
+        return web.json_response({"spreadsheet_id": sheet_id, "version": versions[sheet_id]})
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    async def health_check(request):
+        return web.json_response({"status": "ok"})
+
+    app = web.Application()
+    app.router.add_get("/v4/spreadsheets/{spreadsheet_id}/values:batchGet", values_batch_get)
+    app.router.add_get("/v4/spreadsheets/{spreadsheet_id}/values/{range}", values_get)
+    app.router.add_post("/_bench/bump/{spreadsheet_id}", bump)
+    app.router.add_get("/_bench/stats", get_stats)
+    app.router.add_get("/healthz", health_check)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every values.get")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--classes-per-sheet", type=int, default=CLASSES_PER_SHEET)
+    args = parser.parse_args()
+    web.run_app(
+        build_app(args.latency_ms, args.error_ratio, args.classes_per_sheet),
+        host=args.host, port=args.port, print=None, access_log=None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Local stand-in for the Telegram Bot API.
+
+Answers the methods the bot uses, records every call and can add latency and
+answer a share of sendMessage calls with 429 (retry_after). Point the bot at it
+with TELEGRAM_API_BASE_URL=http://127.0.0.1:<port>/bot.
+
+Updates POSTed to /_bench/updates are handed out by getUpdates, also after a
+deleteWebhook(drop_pending_updates): a bot process started later still gets
+them, so the time from its start to its first reply can be measured.
+
+    python benchmarks/fake_telegram.py --port 9200 --latency-ms 30 --flood-ratio 0.01
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+FIRST_REPLIES = 100
+BOT_USER = {"id": 1000001, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+def build_app(latency_ms=0.0, flood_ratio=0.0, retry_after=1):
+    # replied_at: birinchi FIRST_REPLIES ta javob (sendMessage / editMessageText) vaqti, unix sekund
+    stats = {"calls": {}, "sent": 0, "flood_waits": 0, "chats": set(), "replied_at": []}
+    message_ids = iter(range(1, 1 << 62))
+    updates = []
+    updates_added = asyncio.Event()
+
+    async def read_params(request):
+        # PTB form-encoded yuboradi (murakkab qiymatlar JSON satr ko'rinishida)
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    def message(chat_id, text):
+        return {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+        }
+
+    def record_reply():
+        if len(stats["replied_at"]) < FIRST_REPLIES:
+            stats["replied_at"].append(time.time())
+
+    async def call_method(request):
+        method = request.match_info["method"]
+        stats["calls"][method] = stats["calls"].get(method, 0) + 1
+        params = await read_params(request)
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": BOT_USER})
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            pending = [update for update in updates if update["update_id"] >= offset]
+            if not pending:
+                try:
+                    await asyncio.wait_for(updates_added.wait(), float(params.get("timeout") or 0))
+                except asyncio.TimeoutError:
+                    pass
+                updates_added.clear()
+                pending = [update for update in updates if update["update_id"] >= offset]
+            return web.json_response({"ok": True, "result": pending})
+        if method == "sendMessage":
+            if flood_ratio and random.random() < flood_ratio:
+                stats["flood_waits"] += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, status=429)
+            stats["sent"] += 1
+            stats["chats"].add(params.get("chat_id"))
+            record_reply()
+            return web.json_response({"ok": True, "result": message(params.get("chat_id", 0), params.get("text", ""))})
+        if method == "editMessageText":
+            record_reply()
+            return web.json_response({"ok": True, "result": message(params.get("chat_id", 0), params.get("text", ""))})
+        # answerCallbackQuery, setWebhook, deleteWebhook, ...
+        return web.json_response({"ok": True, "result": True})
+
+    async def get_stats(request):
+        return web.json_response({**stats, "chats": len(stats["chats"])})
+
+    async def reset_stats(request):
+        stats.update({"calls": {}, "sent": 0, "flood_waits": 0, "chats": set(), "replied_at": []})
+        updates.clear()
+        return web.json_response({"ok": True})
+
+    async def add_updates(request):
+        updates.extend(await request.json())
+        updates_added.set()
+        return web.json_response({"ok": True})
+
+    async def health_check(request):
+        return web.json_response({"status": "ok"})
+
+    app = web.Application(client_max_size=4 * 1024 * 1024)
+    app.router.add_post("/bot{token}/{method}", call_method)
+    app.router.add_get("/_bench/stats", get_stats)
+    app.router.add_post("/_bench/reset", reset_stats)
+    app.router.add_post("/_bench/updates", add_updates)
+    app.router.add_get("/healthz", health_check)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every Bot API call")
+    parser.add_argument("--flood-ratio", type=float, default=0.0, help="share of sendMessage calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after (seconds) sent with each 429")
+    args = parser.parse_args()
+    web.run_app(
+        build_app(args.latency_ms, args.flood_ratio, args.retry_after),
+        host=args.host, port=args.port, print=None, access_log=None
+    )
+
+
+if __name__ == "__main__":
+    main()
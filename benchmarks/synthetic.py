@@ -0,0 +1,101 @@
+"""Deterministic synthetic timetables shaped like the real Google Sheets.
+
+Layout (what nmadur_api.build_week_index expects):
+  row 0: "Guruh", then each day's header (DAY_NAMES) above its first para column
+  row 1: para times
+  rows 2..: one 4-row block per class (subject / teacher / groups / room),
+            class name in column A of the block's first row
+Every day is DAY_BLOCK_SIZE columns wide, so the sheet fits in A1:ZZ200.
+Odd versions insert an "Izoh" (notes) column after column A, which moves every
+day band — used to exercise the API's layout re-discovery.
+"""
+import random
+
+# nmadur_api dagi qiymatlar bilan bir xil bo'lishi kerak (API moduli bu yerda import
+# qilinmaydi: benchmark bot modullarini ham yuklaydi, ikkala xizmatda ham metrics.py bor)
+DAY_BLOCK_SIZE = 7
+DAY_NAMES = {
+    "Monday": "Dushanba",
+    "Tuesday": "Seshanba",
+    "Wednesday": "Chorshanba",
+    "Thursday": "Payshanba",
+    "Friday": "Juma",
+    "Saturday": "Shanba",
+    "Sunday": "Yakshanba"
+}
+PARA_TIMES = [
+    "09:00 - 10:20",
+    "10:30 - 11:50",
+    "12:00 - 13:20",
+    "14:20 - 15:40",
+    "15:50 - 17:10",
+    "17:20 - 18:40",
+    "18:50 - 20:10"
+]
+
+# A1:ZZ200 dan 2 ta sarlavha qatori ayiriladi — bitta varaqqa 49 tagacha guruh sig'adi
+CLASSES_PER_SHEET = 40
+SHEET_NAME = "Jadval"
+
+SUBJECTS = [
+    "Matematika", "Fizika", "Dasturlash asoslari", "Ma'lumotlar bazasi", "Ingliz tili",
+    "Algoritmlar", "Tarmoqlar", "Sun'iy intellekt", "Statistika", "Iqtisodiyot",
+]
+TEACHERS = [f"O'qituvchi {i}" for i in range(1, 61)]
+ROOMS = [f"{floor}{room:02d}" for floor in range(1, 6) for room in range(1, 21)]
+
+
+def spreadsheet_id(index):
+    return f"bench{index:04d}"
+
+
+def spreadsheet_url(index):
+    return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id(index)}/edit"
+
+
+def class_names(sheet_id, classes_per_sheet=CLASSES_PER_SHEET):
+    # '_' ishlatilmaydi: bot callback_data ni '_' bo'yicha ajratadi
+    return [f"{sheet_id}-{i:02d}" for i in range(classes_per_sheet)]
+
+
+def sheet_count(total_classes, classes_per_sheet=CLASSES_PER_SHEET):
+    return -(-total_classes // classes_per_sheet)
+
+
+def build_sheet_rows(sheet_id, classes_per_sheet=CLASSES_PER_SHEET, version=0):
+    """Rows of one synthetic sheet; the same (sheet_id, version) always gives the same rows."""
+    rng = random.Random(f"{sheet_id}:{version}")
+    width = 1 + DAY_BLOCK_SIZE * len(DAY_NAMES)
+
+    header = ["Guruh"] + [""] * (width - 1)
+    times = [""] * width
+    for day_index, uz_name in enumerate(DAY_NAMES.values()):
+        start_col = 1 + day_index * DAY_BLOCK_SIZE
+        header[start_col] = uz_name
+        times[start_col:start_col + DAY_BLOCK_SIZE] = PARA_TIMES
+    rows = [header, times]
+
+    for class_name in class_names(sheet_id, classes_per_sheet):
+        block = [[class_name] + [""] * (width - 1) for _ in range(4)]
+        # Har kuni 2-5 ta dars: natija benchmark qaysi kunda ishga tushirilganiga bog'liq bo'lmasin
+        for day_index in range(len(DAY_NAMES)):
+            start_col = 1 + day_index * DAY_BLOCK_SIZE
+            for para_index in sorted(rng.sample(range(DAY_BLOCK_SIZE), rng.randint(2, 5))):
+                col = start_col + para_index
+                block[0][col] = rng.choice(SUBJECTS)
+                block[1][col] = rng.choice(TEACHERS)
+                block[2][col] = class_name
+                block[3][col] = rng.choice(ROOMS)
+        for row in block[1:]:
+            row[0] = ""
+        rows.extend(block)
+
+    if version % 2:
+        for row in rows:
+            row.insert(1, "Izoh" if row is header else "")
+
+    # values.get kabi: oxiridagi bo'sh kataklar qaytarilmaydi
+    for row in rows:
+        while row and row[-1] == "":
+            row.pop()
+    return rows
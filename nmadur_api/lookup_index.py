@@ -0,0 +1,170 @@
+import bisect
+import threading
+
+
+def lookup_key(text):
+    """Case- and spacing-insensitive form of a teacher or room name"""
+    return " ".join(text.split()).casefold()
+
+
+class SheetIndex:
+    """Teachers and room occupancy of one parsed sheet, built once per parse.
+
+    teachers: {key: (name, [(day_index, para_index, class_name, room, subject), ...])}
+    rooms:    {key: (name, bits)} — bit day_index * paras + para_index is set
+              when the room has a lesson in that slot
+    """
+
+    __slots__ = ("teachers", "rooms")
+
+    def __init__(self, week=None, day_names=(), paras=0):
+        self.teachers = {}
+        self.rooms = {}
+        if week is None:
+            return
+        strings = week.strings
+        day_indexes = {day_name: i for i, day_name in enumerate(day_names)}
+        for day_name, classes in week.days.items():
+            day_index = day_indexes.get(day_name)
+            if day_index is None:
+                continue
+            for class_name, lessons in classes.items():
+                fields = [iter(lessons.cells)] * lessons.FIELDS
+                for para, subject, teacher, _, room in zip(*fields):
+                    room_name = strings[room].strip()
+                    teacher_name = strings[teacher].strip()
+                    if teacher_name:
+                        entry = (day_index, para, class_name, room_name, strings[subject])
+                        self.teachers.setdefault(lookup_key(teacher_name), (teacher_name, []))[1].append(entry)
+                    if room_name:
+                        key = lookup_key(room_name)
+                        bits = self.rooms.get(key, (room_name, 0))[1]
+                        self.rooms[key] = (room_name, bits | 1 << (day_index * paras + para))
+
+
+class LookupIndex:
+    """Teacher -> lessons and room -> occupied slots across every parsed sheet.
+
+    Each sheet's SheetIndex is kept. When a sheet is parsed again only the
+    teachers and rooms it has (before or after) are recomputed, from the few
+    sheets that mention them. Free rooms of a slot come from one bitmask per
+    slot over room ids, so a lookup does not scan lessons or rooms.
+    """
+
+    def __init__(self, days, paras):
+        self.days = days
+        self.paras = paras
+        self._lock = threading.Lock()
+        self._sheets = {}          # (spreadsheet_id, sheet_name) -> SheetIndex
+        self._teacher_sheets = {}  # teacher key -> {sheet key}
+        self._room_sheets = {}     # room key -> {sheet key}
+        self._teachers = {}        # teacher key -> (name, sorted entries)
+        self._teacher_keys = []    # sorted, for prefix search
+        self._room_ids = {}        # room key -> bit in the slot masks
+        self._room_names = []      # room id -> name
+        self._room_bits = {}       # room key -> occupied slots
+        self._occupied = [0] * (days * paras)  # slot -> room ids with a lesson
+        self._all_rooms = 0
+
+    def update(self, sheet_key, index):
+        with self._lock:
+            old = self._sheets.get(sheet_key) or SheetIndex()
+            self._sheets[sheet_key] = index
+            # Varaqda o'zgarmagan o'qituvchi / xonalar qayta hisoblanmaydi
+            for key in old.teachers.keys() | index.teachers.keys():
+                if old.teachers.get(key) != index.teachers.get(key):
+                    self._update_teacher(key, sheet_key, key in index.teachers)
+            for key in old.rooms.keys() | index.rooms.keys():
+                if old.rooms.get(key) != index.rooms.get(key):
+                    self._update_room(key, sheet_key, key in index.rooms)
+
+    def _update_teacher(self, key, sheet_key, present):
+        sheets = self._teacher_sheets.setdefault(key, set())
+        if present:
+            sheets.add(sheet_key)
+        else:
+            sheets.discard(sheet_key)
+        if not sheets:
+            del self._teacher_sheets[key]
+            del self._teachers[key]
+            del self._teacher_keys[bisect.bisect_left(self._teacher_keys, key)]
+            return
+        name, entries = None, []
+        for sheet in sheets:
+            sheet_name, sheet_entries = self._sheets[sheet].teachers[key]
+            name = name or sheet_name
+            entries.extend(sheet_entries)
+        if key not in self._teachers:
+            bisect.insort(self._teacher_keys, key)
+        self._teachers[key] = (name, sorted(entries))
+
+    def _update_room(self, key, sheet_key, present):
+        sheets = self._room_sheets.setdefault(key, set())
+        if present:
+            sheets.add(sheet_key)
+        else:
+            sheets.discard(sheet_key)
+        room_id = self._room_ids.get(key)
+        if room_id is None:
+            room_id = self._room_ids[key] = len(self._room_names)
+            self._room_names.append(None)
+        bits = 0
+        for sheet in sheets:
+            name, sheet_bits = self._sheets[sheet].rooms[key]
+            self._room_names[room_id] = self._room_names[room_id] or name
+            bits |= sheet_bits
+        room_bit = 1 << room_id
+        if sheets:
+            self._room_bits[key] = bits
+            self._all_rooms |= room_bit
+        else:
+            # Id qoladi (boshqa xonalarning bitlari siljimasligi uchun), xona ro'yxatdan chiqadi
+            del self._room_sheets[key]
+            self._room_bits.pop(key, None)
+            self._all_rooms &= ~room_bit
+        for slot in range(len(self._occupied)):
+            if bits >> slot & 1:
+                self._occupied[slot] |= room_bit
+            else:
+                self._occupied[slot] &= ~room_bit
+
+    def teacher(self, name, limit=10):
+        """(name, entries) of an exact match and up to `limit` names starting with `name`"""
+        key = lookup_key(name)
+        with self._lock:
+            found = self._teachers.get(key)
+            start = bisect.bisect_left(self._teacher_keys, key)
+            matches = []
+            for candidate in self._teacher_keys[start:start + limit]:
+                if not candidate.startswith(key):
+                    break
+                matches.append(self._teachers[candidate][0])
+        return found, matches
+
+    def free_rooms(self, day_index, para_index):
+        """Names of rooms (seen in any sheet) with no lesson in this slot"""
+        with self._lock:
+            free = self._all_rooms & ~self._occupied[day_index * self.paras + para_index]
+            names = self._room_names
+            rooms = []
+            while free:
+                low = free & -free
+                rooms.append(names[low.bit_length() - 1])
+                free ^= low
+        return sorted(rooms)
+
+    def room(self, name):
+        """(name, occupied slot bits) of a room, or None"""
+        key = lookup_key(name)
+        with self._lock:
+            if key not in self._room_bits:
+                return None
+            return self._room_names[self._room_ids[key]], self._room_bits[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sheets": len(self._sheets),
+                "teachers": len(self._teachers),
+                "rooms": bin(self._all_rooms).count("1"),
+            }
@@ -0,0 +1,91 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Har bir span JSON qator sifatida stdout ga yoziladi ("0" — o'chirilgan)
+TRACE_SPANS = os.getenv("TRACE_SPANS", "1") == "1"
+# Bot shu sarlavhada refresh'ning trace id sini yuboradi
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+SHEETS_UPSTREAM_SECONDS = Histogram(
+    "sheets_upstream_seconds", "Google Sheets API latency by method (get, batchGet)",
+    ["method", "outcome"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+)
+SHEET_PARSE_SECONDS = Histogram(
+    "sheet_parse_seconds", "Time to build the week index, ETags and lookup index of one downloaded sheet",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+API_REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "HTTP request latency by route and status",
+    ["path", "status"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+)
+API_RESPONSE_BYTES = Histogram(
+    "api_response_bytes", "HTTP response body size by route",
+    ["path"], buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576)
+)
+
+STARTUP_SECONDS = Gauge(
+    "api_startup_seconds", "Seconds from process start to each startup phase (ready, sheets_client, snapshots)", ["phase"]
+)
+
+
+class SheetCacheCollector:
+    """Exposes SheetCache.stats() at scrape time"""
+
+    COUNTERS = (
+        "hits", "misses", "coalesced", "upstream_fetches", "evictions",
+        "stale_hits", "stale_errors", "restored", "revalidations", "revalidation_errors",
+    )
+
+    def __init__(self, cache, prefix):
+        self.cache = cache
+        self.prefix = prefix
+
+    def collect(self):
+        stats = self.cache.stats()
+        title = self.prefix.replace("_", " ").capitalize()
+        for name in self.COUNTERS:
+            yield CounterMetricFamily(f"{self.prefix}_{name}", f"{title} {name.replace('_', ' ')}", value=stats[name])
+        yield GaugeMetricFamily(f"{self.prefix}_entries", f"{title} entries", value=stats["entries"])
+        yield GaugeMetricFamily(
+            f"{self.prefix}_hit_ratio", "(hits + coalesced + stale hits) / lookups since start", value=stats["hit_ratio"]
+        )
+
+
+def register_cache(cache, prefix="sheet_cache"):
+    REGISTRY.register(SheetCacheCollector(cache, prefix))
+
+
+def mark_startup(phase, started):
+    """Record and log how long after `started` (time.monotonic() at process start) a startup phase was reached"""
+    elapsed = time.monotonic() - started
+    STARTUP_SECONDS.labels(phase).set(elapsed)
+    print(f"⏱ Ishga tushish: {phase} — {elapsed:.3f} s")
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block and log it as one JSON line tagged with the current request id.
+
+    Yields the attribute dict, so the block can add fields (status, rows, ...).
+    """
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        attrs["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if TRACE_SPANS:
+            print(json.dumps(
+                {"span": name, "request_id": request_id_var.get(), **attrs},
+                ensure_ascii=False, default=str
+            ))
@@ -1,10 +1,27 @@
+import time
+# Ishga tushish vaqti importlardan oldin olinadi (api_startup_seconds shundan hisoblanadi)
+STARTED_AT = time.monotonic()
+
 import os
 import json
-from fastapi import FastAPI, HTTPException
+import uuid
+import hashlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from pydantic import BaseModel
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
 from io import BytesIO
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from sheet_cache import SheetCache
+from snapshot_store import SnapshotStore, read_snapshot
+from timetable import Lessons, StringTable, Week
+from lookup_index import LookupIndex, SheetIndex
+from metrics import (
+    API_REQUEST_SECONDS, API_RESPONSE_BYTES, REQUEST_ID_HEADER, SHEET_PARSE_SECONDS,
+    SHEETS_UPSTREAM_SECONDS, mark_startup, register_cache, request_id_var, span
+)
 
 # --- Google Sheet parametrlari ---
 DAY_BLOCK_SIZE = 7
@@ -27,6 +44,52 @@ PARA_TIMES = [
     "18:50 - 20:10"
 ]
 
+# --- O'qituvchi / xona indekslari (yuklangan barcha varaqlar bo'yicha) ---
+DAY_ORDER = list(DAY_NAMES)
+lookup_index = LookupIndex(days=len(DAY_ORDER), paras=DAY_BLOCK_SIZE)
+
+# --- Sheet kesh parametrlari ---
+SHEET_CACHE_TTL_SECONDS = int(os.getenv("SHEET_CACHE_TTL_SECONDS", 300))
+SHEET_CACHE_MAX_ENTRIES = int(os.getenv("SHEET_CACHE_MAX_ENTRIES", 32))
+# TTL o'tgan varaq shu yoshgacha (oxirgi muvaffaqiyatli yuklashdan beri) darhol qaytariladi va fonda
+# yangilanadi; Google xato bersa yoki javob bermasa ham shu qaytariladi. Undan eskisi qaytarilmaydi
+SHEET_MAX_STALE_SECONDS = int(os.getenv("SHEET_MAX_STALE_SECONDS", 86400))
+
+sheet_cache = SheetCache(
+    ttl_seconds=SHEET_CACHE_TTL_SECONDS,
+    max_entries=SHEET_CACHE_MAX_ENTRIES,
+    max_stale_seconds=SHEET_MAX_STALE_SECONDS
+)
+register_cache(sheet_cache)
+# /schedule va /schedule/batch uchun: varaqning bitta kuni (faqat shu kun ustunlari o'qiladi)
+day_cache = SheetCache(
+    ttl_seconds=SHEET_CACHE_TTL_SECONDS,
+    max_entries=SHEET_CACHE_MAX_ENTRIES * len(DAY_ORDER),
+    max_stale_seconds=SHEET_MAX_STALE_SECONDS
+)
+register_cache(day_cache, "day_cache")
+
+# --- Diskdagi snapshot'lar (har bir varaqning oxirgi muvaffaqiyatli yuklangan qatorlari) ---
+# Qayta ishga tushganda va Google ishlamaganda javoblar shulardan beriladi. Bo'sh bo'lsa o'chirilgan
+SHEET_SNAPSHOT_DIR = os.getenv("SHEET_SNAPSHOT_DIR", "snapshots")
+# Har bir varaqning shuncha eski versiyasi ham saqlanadi (replay_snapshots.py uchun)
+SHEET_SNAPSHOT_HISTORY = int(os.getenv("SHEET_SNAPSHOT_HISTORY", 5))
+
+snapshot_store = SnapshotStore(SHEET_SNAPSHOT_DIR, history=SHEET_SNAPSHOT_HISTORY) if SHEET_SNAPSHOT_DIR else None
+
+# --- Google Sheets client parametrlari ---
+# Bir vaqtda Google'ga ketadigan so'rovlar soni va har bir so'rov uchun timeout
+SHEETS_MAX_CONCURRENCY = int(os.getenv("SHEETS_MAX_CONCURRENCY", 4))
+SHEETS_TIMEOUT_SECONDS = float(os.getenv("SHEETS_TIMEOUT_SECONDS", 20))
+# Bo'sh bo'lsa Google ishlatiladi; benchmark/test uchun lokal soxta server manzili
+# (masalan http://127.0.0.1:9100). Credentials berilmasa so'rovlar imzosiz yuboriladi.
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT", "")
+
+sheets_executor = ThreadPoolExecutor(max_workers=SHEETS_MAX_CONCURRENCY, thread_name_prefix="sheets")
+sheets_credentials = None
+sheets_service = None
+sheets_client_ready = None  # init_sheets_client fonda ishlaydi; Sheets so'rovlari uni kutadi
+
 app = FastAPI(title="Class Schedule API")
 
 class ScheduleRequest(BaseModel):
@@ -35,11 +98,111 @@ class ScheduleRequest(BaseModel):
     class_name: str
     day_name: str
 
+class BatchScheduleRequest(BaseModel):
+    spreadsheet_id: str
+    sheet_name: str
+    day_name: str
+
+class WeekScheduleRequest(BaseModel):
+    spreadsheet_id: str
+    sheet_name: str
+
+class TeacherRequest(BaseModel):
+    name: str
+    day_name: Optional[str] = None
+
+class FreeRoomsRequest(BaseModel):
+    day_name: str
+    para: int
+
+class RoomRequest(BaseModel):
+    name: str
+
+# Span'lari yozilmaydigan (tez-tez chaqiriladigan) endpointlar
+UNTRACED_PATHS = {"/healthz", "/metrics"}
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Tag the request with the caller's X-Request-ID (or a new one), time it and record its size"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    known_paths = {route.path for route in app.routes}
+    path = request.url.path if request.url.path in known_paths else "other"
+    started = time.perf_counter()
+    try:
+        if path in UNTRACED_PATHS:
+            response = await call_next(request)
+        else:
+            with span("api.request", path=path) as attrs:
+                response = await call_next(request)
+                attrs["status"] = response.status_code
+    finally:
+        request_id_var.reset(token)
+    API_REQUEST_SECONDS.labels(path, response.status_code).observe(time.perf_counter() - started)
+    API_RESPONSE_BYTES.labels(path).observe(int(response.headers.get("content-length", 0)))
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
+@app.on_event("startup")
+def start_sheets_client():
+    """Build the Sheets client in the background, so /healthz and cached sheets are served right away"""
+    global sheets_client_ready
+    sheets_client_ready = sheets_executor.submit(init_sheets_client)
+    if snapshot_store is not None:
+        sheets_executor.submit(restore_snapshots)
+    mark_startup("ready", STARTED_AT)
+
+def init_sheets_client():
+    """Build credentials and the Sheets service once; they are reused by every request"""
+    global sheets_credentials, sheets_service
+    # Google kutubxonalari og'ir: ular faqat shu yerda (fonda) import qilinadi
+    from googleapiclient.discovery import build
+    from google.oauth2.service_account import Credentials
+    from google.auth.credentials import AnonymousCredentials
+
+    # --- Credentials JSON ni environment variable dan olish ---
+    creds_json_str = os.getenv("GOOGLE_CREDS_JSON")
+    if creds_json_str:
+        creds_dict = json.loads(creds_json_str)
+        sheets_credentials = Credentials.from_service_account_info(
+            creds_dict,
+            scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
+        )
+    elif SHEETS_API_ENDPOINT:
+        sheets_credentials = AnonymousCredentials()
+    else:
+        print("GOOGLE_CREDS_JSON environment variable topilmadi!")
+        return
+
+    client_options = {"api_endpoint": SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+    sheets_service = build(
+        "sheets", "v4",
+        credentials=sheets_credentials,
+        client_options=client_options,
+        cache_discovery=False
+    )
+    mark_startup("sheets_client", STARTED_AT)
+
+@app.on_event("shutdown")
+def close_sheets_client():
+    sheets_executor.shutdown(wait=False, cancel_futures=True)
+
 # --- Dummy health endpoint (Render uchun port test) ---
 @app.get("/healthz")
 async def health_check():
     return {"status": "ok"}
 
+# --- Prometheus metrikalari ---
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# --- Kesh statistikasi (hit/miss hisoblagichlari) ---
+@app.get("/cache/stats")
+async def cache_stats():
+    snapshots = snapshot_store.stats() if snapshot_store is not None else None
+    return {**sheet_cache.stats(), "days": day_cache.stats(), "lookup": lookup_index.stats(), "snapshots": snapshots}
+
 # --- Funksiyalar ---
 def find_day_column_indexes(first_row):
     day_positions = {}
@@ -52,30 +215,32 @@ def find_day_column_indexes(first_row):
                 break
     return day_positions
 
-def extract_full_day_schedule(all_rows, start_col):
+def extract_full_day_schedule(all_rows, start_col, strings):
+    """Day blocks as [{"class", "lessons": Lessons}]; cell texts are interned into strings"""
     schedule_blocks = []
     i = 0
     while i < len(all_rows):
         class_name = all_rows[i][0] if all_rows[i] else ""
-        lessons = []
+        lessons = Lessons()
         block_rows = all_rows[i:i+4]
         if not any(block_rows):
             i += 4
             continue
+        # Oxirgi blok 4 qatordan qisqa bo'lishi mumkin (pastdagi bo'sh qatorlar qaytarilmaydi)
+        block_rows += [[]] * (4 - len(block_rows))
         for para_index in range(DAY_BLOCK_SIZE):
             subject = block_rows[0][start_col + para_index] if para_index < len(block_rows[0]) - start_col else ""
             teacher = block_rows[1][start_col + para_index] if para_index < len(block_rows[1]) - start_col else ""
             groups = block_rows[2][start_col + para_index] if para_index < len(block_rows[2]) - start_col else ""
             room = block_rows[3][start_col + para_index] if para_index < len(block_rows[3]) - start_col else ""
             if any([subject, teacher, groups, room]):
-                lessons.append({
-                    "para": para_index + 1,
-                    "time": PARA_TIMES[para_index],
-                    "subject": subject,
-                    "teacher": teacher,
-                    "groups": groups,
-                    "room": room
-                })
+                lessons.append(
+                    para_index,
+                    strings.intern(subject),
+                    strings.intern(teacher),
+                    strings.intern(groups),
+                    strings.intern(room)
+                )
         schedule_blocks.append({
             "class": class_name,
             "lessons": lessons
@@ -83,51 +248,492 @@ def extract_full_day_schedule(all_rows, start_col):
         i += 4
     return schedule_blocks
 
-def get_class_schedule(class_name, day_name, rows, day_positions):
-    if day_name not in day_positions:
-        return []
-    start_col = day_positions[day_name]
-    day_schedule = extract_full_day_schedule(rows[2:], start_col)
-    result = []
-    for i in range(len(day_schedule)):
-        block = day_schedule[i]
-        if block["class"] == class_name or (i > 0 and not block["class"]):
-            result.extend(block["lessons"])
+def group_schedule_by_class(day_schedule):
+    """Map every named class block to its lessons.
+
+    Unnamed blocks (other than the first one) are appended to every class,
+    the same way the original per-class lookup treated them.
+    """
+    result = {block["class"]: Lessons() for block in day_schedule if block["class"]}
+    for i, block in enumerate(day_schedule):
+        if block["class"]:
+            result[block["class"]].extend(block["lessons"])
+        elif i > 0:
+            for lessons in result.values():
+                lessons.extend(block["lessons"])
+    return result
+
+def build_week_index(rows, day_positions=None):
+    """Parse every day of the sheet (or only day_positions) once into a compact Week ({day -> {class -> Lessons}})"""
+    strings = StringTable()
+    if not rows:
+        return Week({}, strings, PARA_TIMES)
+    if day_positions is None:
+        day_positions = find_day_column_indexes(rows[0])
+    body = rows[2:]
+    days = {
+        day_name: group_schedule_by_class(extract_full_day_schedule(body, start_col, strings))
+        for day_name, start_col in day_positions.items()
+    }
+    return Week(days, strings, PARA_TIMES)
+
+def rows_digest(rows):
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def schedule_etag(data):
+    """Strong ETag of a JSON response body (same canonical form the bot hashes)"""
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return body_etag(canonical.encode("utf-8"))
+
+def body_etag(body):
+    """ETag of bytes already in that canonical form (Week.render* output)"""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def build_etags(week):
+    """Precompute ETags for every (day, class) schedule, every day batch and the whole week"""
+    return {(day_name, class_name): body_etag(body) for day_name, class_name, body in week.bodies()}
+
+def conditional_response(render, etag, if_none_match, fetched_at):
+    """304 if the client has etag; otherwise render() — canonical JSON bytes of the Week.
+
+    Age is the number of seconds since the sheet was last downloaded from Google.
+    """
+    headers = {"ETag": etag, "Age": str(max(0, int(time.time() - fetched_at)))}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=render(), media_type="application/json", headers=headers)
+
+def requested_max_age(cache_control):
+    """Oldest cached sheet (seconds) the client accepts without asking Google again, or None.
+
+    no-cache / max-age=0 -> 0 (always revalidate), max-age=N -> N, max-stale=0 -> the TTL
+    (no sheet past its TTL). The old sheet is still returned if Google fails.
+    """
+    if not cache_control:
+        return None
+    max_age = None
+    for directive in cache_control.split(","):
+        name, _, value = directive.strip().lower().partition("=")
+        if name == "no-cache":
+            return 0
+        if name == "max-age" and value.isdigit():
+            max_age = min(int(value), SHEET_CACHE_TTL_SECONDS if max_age is None else max_age)
+        elif name == "max-stale" and value == "0" and max_age is None:
+            max_age = SHEET_CACHE_TTL_SECONDS
+    return max_age
+
+# --- Sheet layout (kun ustunlari) keshi ---
+# Butun varaq faqat birinchi marta (yoki sarlavha o'zgarganda) o'qiladi; keyin batchGet
+# bilan faqat sarlavha qatori, A ustuni (guruh nomlari) va kerakli kun(lar) ustunlari olinadi:
+# /schedule/week uchun hamma kunlar, /schedule va /schedule/batch uchun bitta kun.
+SHEET_MAX_ROWS = 200
+FULL_SHEET_RANGE = f"A1:ZZ{SHEET_MAX_ROWS}"
+# (spreadsheet_id, sheet_name) -> {"header": [...], "day_positions": {day_name: start_col}}
+sheet_layouts = {}
+
+def column_letter(index):
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+def a1_range(sheet_name, cells):
+    return "'" + sheet_name.replace("'", "''") + "'!" + cells
+
+def layout_ranges(sheet_name, day_positions):
+    """batchGet ranges: header row, column A below the headers, then one band per day"""
+    ranges = [
+        a1_range(sheet_name, "A1:ZZ1"),
+        a1_range(sheet_name, f"A3:A{SHEET_MAX_ROWS}"),
+    ]
+    for start_col in day_positions.values():
+        end_col = start_col + DAY_BLOCK_SIZE - 1
+        ranges.append(a1_range(sheet_name, f"{column_letter(start_col)}3:{column_letter(end_col)}{SHEET_MAX_ROWS}"))
+    return ranges
+
+def assemble_rows(header, class_column, bands, day_positions):
+    """Rebuild sparse A1:ZZ200-shaped rows (as values.get returns them) from the fetched ranges"""
+    width = max(day_positions.values()) + DAY_BLOCK_SIZE
+    height = max([len(class_column)] + [len(band) for band in bands])
+    rows = [list(header), []]
+    for r in range(height):
+        row = [""] * width
+        if r < len(class_column) and class_column[r]:
+            row[0] = class_column[r][0]
+        for start_col, band in zip(day_positions.values(), bands):
+            if r < len(band):
+                row[start_col:start_col + len(band[r])] = band[r]
+        while row and row[-1] == "":
+            row.pop()
+        rows.append(row)
+    while len(rows) > 2 and not rows[-1]:
+        rows.pop()
+    return rows
+
+def execute_upstream(request, method, **attrs):
+    """Run one Sheets API request, timed into sheets_upstream_seconds and a trace span"""
+    from google_auth_httplib2 import AuthorizedHttp
+    import httplib2
+
+    # httplib2.Http is not thread-safe, so each call gets its own; the
+    # credentials (and their refreshed token) are shared.
+    http = AuthorizedHttp(sheets_credentials, http=httplib2.Http(timeout=SHEETS_TIMEOUT_SECONDS))
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with span("sheets." + method, **attrs):
+            result = request.execute(http=http)
+            outcome = "ok"
+    finally:
+        SHEETS_UPSTREAM_SECONDS.labels(method, outcome).observe(time.perf_counter() - started)
     return result
 
+def download_full_sheet(spreadsheet_id, sheet_name):
+    RANGE = f"{sheet_name}!{FULL_SHEET_RANGE}"
+    sheet = execute_upstream(
+        sheets_service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=RANGE),
+        "get", spreadsheet_id=spreadsheet_id, sheet=sheet_name
+    )
+    return sheet.get("values", [])
+
+def require_sheets_service():
+    """Wait for the background client build; HTTP 500 if there is no client (no credentials)"""
+    if sheets_client_ready is not None:
+        # Birinchi so'rovlar client qurilishini kutadi (sheets_executor ichida)
+        sheets_client_ready.result()
+    if sheets_service is None:
+        raise HTTPException(status_code=500, detail="GOOGLE_CREDS_JSON environment variable topilmadi!")
+
+def download_layout_rows(spreadsheet_id, sheet_name, layout, day_positions=None):
+    """Fetch only the known bands (of day_positions, default all days); None if the header row changed"""
+    require_sheets_service()
+    day_positions = day_positions or layout["day_positions"]
+    ranges = layout_ranges(sheet_name, day_positions)
+    result = execute_upstream(
+        sheets_service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id, ranges=ranges, majorDimension="ROWS"
+        ),
+        "batchGet", spreadsheet_id=spreadsheet_id, sheet=sheet_name, ranges=len(ranges)
+    )
+    value_ranges = [value_range.get("values", []) for value_range in result.get("valueRanges", [])]
+    if len(value_ranges) != len(ranges):
+        return None
+    header = value_ranges[0][0] if value_ranges[0] else []
+    if header != layout["header"]:
+        return None
+    return assemble_rows(header, value_ranges[1], value_ranges[2:], day_positions)
+
+def download_sheet_rows(spreadsheet_id, sheet_name):
+    require_sheets_service()
+
+    key = (spreadsheet_id, sheet_name)
+    layout = sheet_layouts.get(key)
+    if layout:
+        rows = download_layout_rows(spreadsheet_id, sheet_name, layout)
+        if rows is not None:
+            return rows
+        print(f"Jadval tuzilishi o'zgardi, qayta o'qilmoqda: {sheet_name}")
+
+    rows = download_full_sheet(spreadsheet_id, sheet_name)
+    remember_layout(key, rows)
+    layout = sheet_layouts.get(key)
+    if layout:
+        # batchGet qaytaradigan shaklga keltiriladi: bir xil varaq ikkala yo'l bilan ham bir xil hash beradi
+        # (aks holda har bir to'liq o'qishdan keyin snapshot'ning yangi versiyasi yozilardi)
+        body = rows[2:]
+        bands = [[row[start_col:start_col + DAY_BLOCK_SIZE] for row in body] for start_col in layout["day_positions"].values()]
+        rows = assemble_rows(rows[0], [row[:1] for row in body], bands, layout["day_positions"])
+    return rows
+
+def remember_layout(key, rows):
+    day_positions = find_day_column_indexes(rows[0]) if rows else {}
+    if day_positions:
+        sheet_layouts[key] = {"header": rows[0], "day_positions": day_positions}
+    else:
+        sheet_layouts.pop(key, None)
+
+def parse_sheet(spreadsheet_id, sheet_name, rows, digest, fetched_at):
+    with SHEET_PARSE_SECONDS.time(), span("sheet.parse", sheet=sheet_name, rows=len(rows)):
+        week = build_week_index(rows)
+        etags = build_etags(week)
+        # Indeksda faqat shu varaqning o'qituvchi va xonalari qayta hisoblanadi
+        lookup_index.update((spreadsheet_id, sheet_name), SheetIndex(week, DAY_ORDER, DAY_BLOCK_SIZE))
+    return {
+        "digest": digest,
+        "empty": not rows,
+        "week": week,
+        "etags": etags,
+        "fetched_at": fetched_at,
+    }
+
+def load_parsed_sheet(spreadsheet_id, sheet_name):
+    """Download the sheet and parse it, reusing the old week index if nothing changed"""
+    rows = download_sheet_rows(spreadsheet_id, sheet_name)
+    fetched_at = time.time()
+    digest = rows_digest(rows)
+    if rows:
+        save_snapshot(spreadsheet_id, sheet_name, rows, digest, fetched_at)
+    previous = sheet_cache.peek((spreadsheet_id, sheet_name))
+    if previous and previous["digest"] == digest:
+        return {**previous, "fetched_at": fetched_at}
+    return parse_sheet(spreadsheet_id, sheet_name, rows, digest, fetched_at)
+
+class LayoutChanged(Exception):
+    """The header row of a sheet no longer matches its recorded layout"""
+
+def load_parsed_day(spreadsheet_id, sheet_name, day_name):
+    """Download one day's band of the sheet and parse it into a one-day Week.
+
+    If the header row changed, the layout is forgotten and LayoutChanged is
+    raised: get_parsed_day then reads the whole sheet once through sheet_cache.
+    """
+    key = (spreadsheet_id, sheet_name)
+    layout = sheet_layouts.get(key)
+    start_col = layout["day_positions"].get(day_name) if layout else None
+    rows = None
+    if start_col is not None:
+        rows = download_layout_rows(spreadsheet_id, sheet_name, layout, {day_name: start_col})
+    if rows is None:
+        # Har bir kun o'zi butun varaqni o'qimaydi: keyingi o'qish sheet_cache orqali bitta bo'ladi
+        sheet_layouts.pop(key, None)
+        raise LayoutChanged(sheet_name)
+    fetched_at = time.time()
+    digest = rows_digest(rows)
+    previous = day_cache.peek(key + (day_name,))
+    if previous and previous["digest"] == digest:
+        return {**previous, "fetched_at": fetched_at}
+    # Qidiruv indeksi faqat butun varaqdan yangilanadi (bitta kun boshqa kunlarni o'chirib yubormasin)
+    with SHEET_PARSE_SECONDS.time(), span("sheet.parse", sheet=sheet_name, day=day_name, rows=len(rows)):
+        week = build_week_index(rows, {day_name: start_col})
+        etags = build_etags(week)
+    return {"digest": digest, "empty": False, "week": week, "etags": etags, "fetched_at": fetched_at}
+
+# --- Snapshot'lar ---
+def save_snapshot(spreadsheet_id, sheet_name, rows, digest, fetched_at):
+    if snapshot_store is None:
+        return
+    try:
+        snapshot_store.save(spreadsheet_id, sheet_name, rows, digest, fetched_at)
+    except OSError as e:
+        # Disk xatosi javobni to'xtatmaydi — faqat keyingi tiklash eskiroq snapshot'dan bo'ladi
+        print(f"Snapshot yozilmadi ({sheet_name}): {e}")
+
+def restore_parsed_sheet(spreadsheet_id, sheet_name):
+    """(age in seconds, parsed sheet) from the sheet's snapshot, or None if there is none younger than SHEET_MAX_STALE_SECONDS"""
+    if snapshot_store is None:
+        return None
+    snapshot = snapshot_store.load(spreadsheet_id, sheet_name, max_age=SHEET_MAX_STALE_SECONDS)
+    if snapshot is None:
+        return None
+    key = (spreadsheet_id, sheet_name)
+    if key not in sheet_layouts:
+        # Keyingi yangilash butun varaqni emas, faqat kun ustunlarini o'qiydi
+        remember_layout(key, snapshot.rows)
+    sheet = parse_sheet(spreadsheet_id, sheet_name, snapshot.rows, snapshot.digest, snapshot.fetched_at)
+    return snapshot.age, sheet
+
+def restore_snapshots():
+    """Startup: put the newest snapshots into the sheet cache (and the lookup index) before Google is asked"""
+    headers = []
+    for path in snapshot_store.paths():
+        try:
+            header = read_snapshot(path, with_rows=False)
+        except (OSError, ValueError) as e:
+            print(f"Snapshot o'qilmadi ({path}): {e}")
+            continue
+        if header.age < SHEET_MAX_STALE_SECONDS:
+            headers.append(header)
+    headers.sort(key=lambda header: header.fetched_at)
+    restored = 0
+    for header in headers[-SHEET_CACHE_MAX_ENTRIES:]:
+        key = (header.spreadsheet_id, header.sheet_name)
+        if sheet_cache.peek(key) is not None:
+            continue
+        result = restore_parsed_sheet(*key)
+        if result is not None:
+            sheet_cache.put(key, result[1], age=result[0])
+            restored += 1
+    print(f"Snapshot'lardan tiklandi: {restored} ta varaq")
+    mark_startup("snapshots", STARTED_AT)
+
+async def get_parsed_sheet(spreadsheet_id, sheet_name, max_age=None):
+    """Return the parsed sheet; a miss is served from its snapshot if there is one, else downloaded.
+
+    A sheet past its TTL is returned as is while it is refreshed in the
+    background. A sheet older than max_age is re-read from Google first, and
+    the old one is returned only if Google fails or times out.
+    """
+    key = (spreadsheet_id, sheet_name)
+    try:
+        sheet = await asyncio.wait_for(
+            sheet_cache.get(
+                key,
+                lambda: load_parsed_sheet(spreadsheet_id, sheet_name),
+                sheets_executor,
+                restore=lambda: restore_parsed_sheet(spreadsheet_id, sheet_name),
+                max_age=max_age
+            ),
+            timeout=SHEETS_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        sheet = sheet_cache.stale(key)
+        if sheet is None:
+            raise HTTPException(status_code=504, detail="Google Sheets javob bermadi")
+    if sheet["empty"]:
+        raise HTTPException(status_code=404, detail="Jadval bo'sh")
+    return sheet
+
+async def get_parsed_day(spreadsheet_id, sheet_name, day_name, max_age=None):
+    """Return a parsed sheet that holds day_name (for /schedule and /schedule/batch).
+
+    The whole week is used while it is cached and fresh, or while the sheet
+    layout is not known yet. Otherwise only the day's column band is
+    downloaded; a miss starts from the cached week (even a stale one), so
+    stale-while-revalidate and stale-if-error work per day as well. If the
+    header row changed meanwhile, the whole week is read through sheet_cache.
+    """
+    key = (spreadsheet_id, sheet_name)
+    layout = sheet_layouts.get(key)
+    cached = sheet_cache.aged(key)
+    fresh_for = SHEET_CACHE_TTL_SECONDS if max_age is None else min(max_age, SHEET_CACHE_TTL_SECONDS)
+    if not layout or day_name not in layout["day_positions"] or (cached and cached[0] < fresh_for):
+        return await get_parsed_sheet(spreadsheet_id, sheet_name, max_age)
+
+    day_key = key + (day_name,)
+    try:
+        sheet = await asyncio.wait_for(
+            day_cache.get(
+                day_key,
+                lambda: load_parsed_day(spreadsheet_id, sheet_name, day_name),
+                sheets_executor,
+                restore=lambda: sheet_cache.aged(key),
+                max_age=max_age
+            ),
+            timeout=SHEETS_TIMEOUT_SECONDS
+        )
+    except LayoutChanged:
+        sheet = None
+    except Exception as e:
+        sheet = day_cache.stale(day_key) or sheet_cache.stale(key)
+        if sheet is None:
+            if isinstance(e, asyncio.TimeoutError):
+                raise HTTPException(status_code=504, detail="Google Sheets javob bermadi")
+            raise
+    if key not in sheet_layouts:
+        # Sarlavha o'zgardi: butun varaq bir marta (single-flight) o'qiladi va sheet_cache'ga yoziladi
+        return await get_parsed_sheet(spreadsheet_id, sheet_name, max_age)
+    if sheet["empty"]:
+        raise HTTPException(status_code=404, detail="Jadval bo'sh")
+    return sheet
+
 # --- API endpoint ---
 @app.post("/schedule/")
-def fetch_schedule(req: ScheduleRequest):
+async def fetch_schedule(
+    req: ScheduleRequest, if_none_match: Optional[str] = Header(None), cache_control: Optional[str] = Header(None)
+):
     try:
-        # --- Credentials JSON ni environment variable dan olish ---
-        creds_json_str = os.getenv("GOOGLE_CREDS_JSON")
-        if not creds_json_str:
-            raise HTTPException(status_code=500, detail="GOOGLE_CREDS_JSON environment variable topilmadi!")
+        sheet = await get_parsed_day(req.spreadsheet_id, req.sheet_name, req.day_name, requested_max_age(cache_control))
+        week = sheet["week"]
+        render = lambda: week.render_lessons(req.day_name, req.class_name)
+        etag = sheet["etags"].get((req.day_name, req.class_name)) or body_etag(render())
+        return conditional_response(render, etag, if_none_match, sheet["fetched_at"])
 
-        creds_dict = json.loads(creds_json_str)
-        creds = Credentials.from_service_account_info(
-            creds_dict,
-            scopes=["https://www.googleapis.com/auth/spreadsheets.readonly"]
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        service = build("sheets", "v4", credentials=creds)
-        RANGE = f"{req.sheet_name}!A1:ZZ200"
-        sheet = service.spreadsheets().values().get(
-            spreadsheetId=req.spreadsheet_id,
-            range=RANGE
-        ).execute()
-
-        rows = sheet.get("values", [])
-        if not rows:
-            raise HTTPException(status_code=404, detail="Jadval bo'sh")
-        
-        day_positions = find_day_column_indexes(rows[0])
-        schedule = get_class_schedule(req.class_name, req.day_name, rows, day_positions)
-        return schedule
+@app.post("/schedule/batch")
+async def fetch_schedule_batch(
+    req: BatchScheduleRequest, if_none_match: Optional[str] = Header(None), cache_control: Optional[str] = Header(None)
+):
+    """Return {class_name: lessons} for every class of the sheet"""
+    try:
+        sheet = await get_parsed_day(req.spreadsheet_id, req.sheet_name, req.day_name, requested_max_age(cache_control))
+        week = sheet["week"]
+        render = lambda: week.render_day(req.day_name)
+        etag = sheet["etags"].get((req.day_name, None)) or body_etag(render())
+        return conditional_response(render, etag, if_none_match, sheet["fetched_at"])
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/schedule/week")
+async def fetch_schedule_week(
+    req: WeekScheduleRequest, if_none_match: Optional[str] = Header(None), cache_control: Optional[str] = Header(None)
+):
+    """Return {day_name: {class_name: lessons}} for the whole sheet from one fetch"""
+    try:
+        sheet = await get_parsed_sheet(req.spreadsheet_id, req.sheet_name, requested_max_age(cache_control))
+        return conditional_response(
+            sheet["week"].render, sheet["etags"][(None, None)], if_none_match, sheet["fetched_at"]
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- O'qituvchi va xona qidiruvi ---
+def day_index(day_name):
+    if day_name not in DAY_NAMES:
+        raise HTTPException(status_code=400, detail=f"Noma'lum kun: {day_name}")
+    return DAY_ORDER.index(day_name)
+
+def para_index(para):
+    if not 1 <= para <= DAY_BLOCK_SIZE:
+        raise HTTPException(status_code=400, detail=f"Para 1..{DAY_BLOCK_SIZE} oralig'ida bo'lishi kerak")
+    return para - 1
+
+@app.post("/teacher")
+async def find_teacher(req: TeacherRequest):
+    """Lessons of one teacher across every loaded sheet; classes sharing a slot are merged.
+
+    If the name is not an exact match, `teacher` is null and `matches` lists
+    teachers whose name starts with it.
+    """
+    only_day = day_index(req.day_name) if req.day_name else None
+    found, matches = lookup_index.teacher(req.name)
+    lessons = []
+    if found:
+        slots = {}
+        for day, para, class_name, room, subject in found[1]:
+            if only_day is not None and day != only_day:
+                continue
+            lesson = slots.get((day, para, room, subject))
+            if lesson is None:
+                lesson = slots[(day, para, room, subject)] = {
+                    "day": DAY_ORDER[day], "para": para + 1, "time": PARA_TIMES[para],
+                    "room": room, "subject": subject, "classes": [],
+                }
+                lessons.append(lesson)
+            lesson["classes"].append(class_name)
+    return {"teacher": found[0] if found else None, "lessons": lessons, "matches": matches}
+
+@app.post("/rooms/free")
+async def find_free_rooms(req: FreeRoomsRequest):
+    """Rooms (seen in any loaded sheet) without a lesson in this day and para"""
+    rooms = lookup_index.free_rooms(day_index(req.day_name), para_index(req.para))
+    return {"day": req.day_name, "para": req.para, "time": PARA_TIMES[req.para - 1], "rooms": rooms}
+
+@app.post("/room")
+async def find_room(req: RoomRequest):
+    """Busy paras of one room per day"""
+    room = lookup_index.room(req.name)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Xona topilmadi")
+    name, bits = room
+    busy = {
+        day_name: [para + 1 for para in range(DAY_BLOCK_SIZE) if bits >> (day * DAY_BLOCK_SIZE + para) & 1]
+        for day, day_name in enumerate(DAY_ORDER)
+    }
+    return {"room": name, "busy": {day_name: paras for day_name, paras in busy.items() if paras}}
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -0,0 +1,93 @@
+"""Replay stored sheet snapshots through the parser, offline (no Google, no server).
+
+    python replay_snapshots.py                              # every snapshot in SHEET_SNAPSHOT_DIR, with history
+    python replay_snapshots.py snapshots/0a1b....snap
+    python replay_snapshots.py --save-baseline base.json    # record how each snapshot parses
+    python replay_snapshots.py --baseline base.json         # exit 1 if any snapshot now parses differently
+
+Each snapshot's rows are checked against its stored hash and parsed with
+build_week_index; the week ETag identifies the parse result.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from nmadur_api import SHEET_SNAPSHOT_DIR, body_etag, build_week_index, rows_digest
+from snapshot_store import SnapshotStore, read_snapshot
+
+
+def replay(path):
+    snapshot = read_snapshot(path)
+    started = time.perf_counter()
+    week = build_week_index(snapshot.rows)
+    parse_ms = (time.perf_counter() - started) * 1000
+    return {
+        "sheet": snapshot.sheet_name,
+        "spreadsheet_id": snapshot.spreadsheet_id,
+        "fetched_at": datetime.fromtimestamp(snapshot.fetched_at).isoformat(timespec="seconds"),
+        "hash_ok": rows_digest(snapshot.rows) == snapshot.digest,
+        "days": len(week.days),
+        "classes": len({class_name for classes in week.days.values() for class_name in classes}),
+        "lessons": sum(len(lessons) for classes in week.days.values() for lessons in classes.values()),
+        "parse_ms": round(parse_ms, 2),
+        "etag": body_etag(week.render()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="snapshot files (default: every snapshot in --dir)")
+    parser.add_argument("--dir", default=SHEET_SNAPSHOT_DIR or "snapshots")
+    parser.add_argument("--current-only", action="store_true", help="skip older versions kept as history")
+    parser.add_argument("--baseline", help="compare week ETags with this file")
+    parser.add_argument("--save-baseline", help="write the week ETags to this file")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        if not os.path.isdir(args.dir):
+            parser.error(f"snapshot papkasi topilmadi: {args.dir}")
+        paths = SnapshotStore(args.dir).paths(include_history=not args.current_only)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    failed = 0
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            result = results[name] = replay(path)
+        except Exception as e:
+            failed += 1
+            print(f"XATO     {name}: {e!r}")
+            continue
+        if not result["hash_ok"]:
+            status = "HASH"
+        elif not args.baseline:
+            status = "ok"
+        elif name not in baseline:
+            status = "NEW"
+        elif baseline[name] == result["etag"]:
+            status = "SAME"
+        else:
+            status = "CHANGED"
+        failed += status in ("HASH", "CHANGED")
+        print(
+            f"{status:<8} {name}  {result['sheet']} ({result['fetched_at']}): {result['days']} kun, "
+            f"{result['classes']} guruh, {result['lessons']} dars, {result['parse_ms']} ms  {result['etag']}"
+        )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({name: result["etag"] for name, result in results.items()}, f, indent=2, sort_keys=True)
+    print(f"{len(paths)} ta snapshot, {failed} ta xato yoki farq")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+
+
+class SheetCache:
+    """In-process TTL + LRU cache of downloaded sheets with single-flight loading.
+
+    Keys are (spreadsheet_id, sheet_name). Concurrent callers asking for the same
+    key while it is being downloaded wait for the one upstream fetch instead of
+    starting their own.
+
+    A value older than ttl_seconds but younger than max_stale_seconds is served
+    right away while it is reloaded in the background (stale-while-revalidate),
+    and is also served when a reload fails (stale-if-error).
+    """
+
+    def __init__(self, ttl_seconds=300, max_entries=32, max_stale_seconds=0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_stale_seconds = max_stale_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._inflight = {}            # key -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.stale_errors = 0
+        self.restored = 0
+        self.revalidations = 0
+        self.revalidation_errors = 0
+
+    async def get(self, key, loader, executor, restore=None, max_age=None):
+        """Return the value for key, running loader() on executor at most once at a time per key.
+
+        On a miss, restore() -> (age_seconds, value) or None is tried before
+        loader() (e.g. a snapshot on disk). With max_age (seconds, capped at
+        ttl_seconds) an older value is not served right away: the caller waits
+        for loader() and gets the old value only if it fails.
+        """
+        fresh_for = self.ttl_seconds if max_age is None else min(max_age, self.ttl_seconds)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                age = time.monotonic() - entry[0]
+                if age < fresh_for:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if age < self.max_stale_seconds and max_age is None:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    self._revalidate(key, loader, executor)
+                    return entry[1]
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                restore = restore if entry is None else None
+                future = self._submit(executor, key, self._load_missing, key, loader, executor, restore, max_age)
+
+        try:
+            # shield: a waiter that gives up must not cancel the fetch other waiters share
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except Exception:
+            value = self.stale(key)
+            if value is None:
+                raise
+            with self._lock:
+                self.stale_errors += 1
+            return value
+
+    def _submit(self, executor, key, function, *args):
+        # loader runs with the caller's context vars (request id of trace spans)
+        future = executor.submit(contextvars.copy_context().run, function, *args)
+        self._inflight[key] = future
+        return future
+
+    def _revalidate(self, key, loader, executor):
+        """Start a background reload of key (called with the lock held)"""
+        if key in self._inflight:
+            return
+        self.revalidations += 1
+        self._submit(executor, key, self._load, key, loader).add_done_callback(self._revalidated)
+
+    def _revalidated(self, future):
+        if future.cancelled() or future.exception() is None:
+            return
+        with self._lock:
+            self.revalidation_errors += 1
+        print(f"Jadvalni fonda yangilashda xato: {future.exception()!r}")
+
+    def _load_missing(self, key, loader, executor, restore, max_age):
+        restored = None
+        if restore is not None:
+            try:
+                restored = restore()
+            except Exception as e:
+                # Buzilgan zaxira nusxa — oddiy miss kabi loader() ishlatiladi
+                print(f"Keshni tiklashda xato ({key}): {e!r}")
+        if restored is not None and restored[0] < self.max_stale_seconds:
+            age, value = restored
+            with self._lock:
+                self.restored += 1
+                self._store(key, value, time.monotonic() - age)
+                if max_age is None or age < min(max_age, self.ttl_seconds):
+                    self._inflight.pop(key, None)
+                    if age >= self.ttl_seconds:
+                        self._revalidate(key, loader, executor)
+                    return value
+        return self._load(key, loader)
+
+    def _load(self, key, loader):
+        with self._lock:
+            self.fetches += 1
+        try:
+            value = loader()
+        except BaseException:
+            with self._lock:
+                self._inflight.pop(key, None)
+            raise
+        with self._lock:
+            self._store(key, value)
+            self._inflight.pop(key, None)
+        return value
+
+    def peek(self, key):
+        """Return the stored value for key even if it has expired, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry else None
+
+    def aged(self, key):
+        """Return (age_seconds, value) for key even if it has expired, or None; no LRU touch"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return (time.monotonic() - entry[0], entry[1]) if entry else None
+
+    def stale(self, key):
+        """Return the stored value for key if it is younger than max_stale_seconds, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.max_stale_seconds:
+                return entry[1]
+            return None
+
+    def put(self, key, value, age=0.0):
+        """Store a value restored from elsewhere (e.g. disk) that was loaded `age` seconds ago"""
+        with self._lock:
+            self.restored += 1
+            self._store(key, value, time.monotonic() - age)
+
+    def _store(self, key, value, stored_at=None):
+        self._entries[key] = (time.monotonic() if stored_at is None else stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced + self.stale_hits
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "max_stale_seconds": self.max_stale_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale_hits": self.stale_hits,
+                "stale_errors": self.stale_errors,
+                "restored": self.restored,
+                "upstream_fetches": self.fetches,
+                "revalidations": self.revalidations,
+                "revalidation_errors": self.revalidation_errors,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.coalesced + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,140 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Fayl: HEADER, meta JSON (spreadsheet_id, sheet_name), keyin zlib bilan siqilgan qatorlar JSON
+MAGIC = b"NMSNAP1\n"
+# magic, fetched_at (unix sekund), qatorlarning sha1 (rows_digest), meta uzunligi, payload uzunligi
+HEADER = struct.Struct("<8sd20sII")
+FETCHED_AT = struct.Struct("<d")
+SUFFIX = ".snap"
+COMPRESS_LEVEL = 6
+
+
+class Snapshot:
+    """One stored sheet: its values rows (as download_sheet_rows returns them), fetch time and hash"""
+
+    __slots__ = ("path", "spreadsheet_id", "sheet_name", "fetched_at", "digest", "size", "rows")
+
+    def __init__(self, path, spreadsheet_id, sheet_name, fetched_at, digest, size, rows=None):
+        self.path = path
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.fetched_at = fetched_at
+        self.digest = digest
+        self.size = size
+        self.rows = rows
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+def read_snapshot(path, with_rows=True):
+    """Read a snapshot file through mmap; the payload is only decompressed if with_rows.
+
+    Raises ValueError on a file that is not a (complete) snapshot.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if len(view) < HEADER.size:
+            raise ValueError(f"snapshot header is truncated: {path}")
+        magic, fetched_at, digest, meta_size, payload_size = HEADER.unpack_from(view)
+        start = HEADER.size + meta_size
+        if magic != MAGIC or len(view) != start + payload_size:
+            raise ValueError(f"not a sheet snapshot: {path}")
+        meta = json.loads(view[HEADER.size:start])
+        rows = None
+        if with_rows:
+            # Siqilgan qism nusxa olinmasdan to'g'ridan-to'g'ri mmap'dan o'qiladi
+            with memoryview(view) as buffer, buffer[start:] as payload:
+                rows = json.loads(zlib.decompress(payload))
+        return Snapshot(path, meta["spreadsheet_id"], meta["sheet_name"], fetched_at, digest.hex(), len(view), rows)
+
+
+class SnapshotStore:
+    """Last-known-good copy of every downloaded sheet, one compressed file per sheet.
+
+    The current file of a sheet is rewritten only when its rows change; a
+    refetch with the same hash just updates the fetch time in the header. The
+    replaced version is kept as `<name>.<fetched_at ms>.snap` (up to `history`
+    per sheet), so older layouts can be replayed against the parser.
+    """
+
+    def __init__(self, directory, history=5):
+        self.directory = directory
+        self.history = history
+        self._lock = threading.Lock()
+
+    def path_for(self, spreadsheet_id, sheet_name):
+        name = hashlib.sha1(f"{spreadsheet_id}\0{sheet_name}".encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def load(self, spreadsheet_id, sheet_name, max_age=None):
+        """The sheet's current snapshot with rows, or None (missing, unreadable or older than max_age)"""
+        path = self.path_for(spreadsheet_id, sheet_name)
+        with self._lock:
+            try:
+                header = read_snapshot(path, with_rows=False)
+                if max_age is not None and header.age >= max_age:
+                    return None
+                return read_snapshot(path)
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError, zlib.error) as e:
+                print(f"Snapshot o'qilmadi ({path}): {e}")
+                return None
+
+    def save(self, spreadsheet_id, sheet_name, rows, digest, fetched_at):
+        """Store rows fetched at fetched_at; returns False if only the fetch time was updated"""
+        path = self.path_for(spreadsheet_id, sheet_name)
+        with self._lock:
+            try:
+                current = read_snapshot(path, with_rows=False)
+            except (OSError, ValueError):
+                current = None
+            if current is not None and current.digest == digest:
+                with open(path, "r+b") as f:
+                    f.seek(len(MAGIC))
+                    f.write(FETCHED_AT.pack(fetched_at))
+                return False
+
+            meta = json.dumps({"spreadsheet_id": spreadsheet_id, "sheet_name": sheet_name}, ensure_ascii=False).encode("utf-8")
+            payload = zlib.compress(
+                json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), COMPRESS_LEVEL
+            )
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(HEADER.pack(MAGIC, fetched_at, bytes.fromhex(digest), len(meta), len(payload)))
+                f.write(meta)
+                f.write(payload)
+            if current is not None and self.history:
+                stem = path[:-len(SUFFIX)]
+                os.replace(path, f"{stem}.{int(current.fetched_at * 1000)}{SUFFIX}")
+                for old in sorted(glob.glob(glob.escape(stem) + ".*" + SUFFIX))[:-self.history]:
+                    os.remove(old)
+            os.replace(temporary, path)
+            return True
+
+    def paths(self, include_history=False):
+        """Snapshot files in the store (current ones, plus older versions if include_history)"""
+        paths = sorted(glob.glob(os.path.join(glob.escape(self.directory), "*" + SUFFIX)))
+        if include_history:
+            return paths
+        return [path for path in paths if "." not in os.path.basename(path)[:-len(SUFFIX)]]
+
+    def stats(self):
+        paths = self.paths(include_history=True)
+        current = self.paths()
+        return {
+            "directory": self.directory,
+            "sheets": len(current),
+            "history": len(paths) - len(current),
+            "bytes": sum(os.path.getsize(path) for path in paths if os.path.exists(path)),
+        }
@@ -0,0 +1,146 @@
+import json
+from array import array
+
+# Bitta darsning kanonik JSON ko'rinishi (kalitlar saralangan, bo'sh joysiz) —
+# bot ETag'ni aynan shu shakldan hisoblaydi
+LESSON_JSON = '{"groups":%s,"para":%d,"room":%s,"subject":%s,"teacher":%s,"time":%s}'
+
+
+def json_string(text):
+    return json.dumps(text, ensure_ascii=False)
+
+
+class StringTable:
+    """Every distinct cell text of one sheet, stored once; lessons keep integer ids into it"""
+
+    __slots__ = ("strings", "_ids")
+
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def intern(self, text):
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = self._ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+
+class Lessons:
+    """One class's lessons on one day, packed into a single unsigned int array.
+
+    Each lesson is FIELDS consecutive values: the para index into PARA_TIMES,
+    then the string ids of subject, teacher, groups and room.
+    """
+
+    __slots__ = ("cells",)
+    FIELDS = 5
+
+    def __init__(self):
+        self.cells = array("I")
+
+    def append(self, para_index, subject_id, teacher_id, groups_id, room_id):
+        self.cells.extend((para_index, subject_id, teacher_id, groups_id, room_id))
+
+    def extend(self, other):
+        self.cells.extend(other.cells)
+
+    def __len__(self):
+        return len(self.cells) // self.FIELDS
+
+    def to_json(self, strings, para_times):
+        cells = self.cells
+        return [
+            {
+                "para": cells[i] + 1,
+                "time": para_times[cells[i]],
+                "subject": strings[cells[i + 1]],
+                "teacher": strings[cells[i + 2]],
+                "groups": strings[cells[i + 3]],
+                "room": strings[cells[i + 4]],
+            }
+            for i in range(0, len(cells), self.FIELDS)
+        ]
+
+    def render(self, encoded, encoded_times):
+        """Canonical JSON text from pre-encoded strings, without building dicts"""
+        fields = [iter(self.cells)] * self.FIELDS
+        return "[" + ",".join([
+            LESSON_JSON % (encoded[groups], para + 1, encoded[room], encoded[subject], encoded[teacher], encoded_times[para])
+            for para, subject, teacher, groups, room in zip(*fields)
+        ]) + "]"
+
+
+class Week:
+    """A parsed sheet: {day_name: {class_name: Lessons}} over one sheet's strings.
+
+    render_* return the API response bodies in the canonical form the ETags
+    are computed from; to_json() gives the same data as plain dicts.
+    """
+
+    __slots__ = ("days", "strings", "para_times", "encoded", "encoded_times", "encoded_keys")
+
+    def __init__(self, days, strings, para_times):
+        # Kalitlar oldindan saralanadi — render paytida sort_keys kerak emas
+        self.days = {
+            day_name: dict(sorted(classes.items()))
+            for day_name, classes in sorted(days.items())
+        }
+        self.strings = strings.strings
+        self.para_times = para_times
+        # Har bir matn bir marta JSON'ga aylantiriladi, keyin faqat ulanadi
+        self.encoded = [json_string(text) for text in self.strings]
+        self.encoded_times = [json_string(text) for text in para_times]
+        self.encoded_keys = {
+            key: json_string(key)
+            for classes in self.days.values() for key in classes
+        }
+        self.encoded_keys.update((day_name, json_string(day_name)) for day_name in self.days)
+
+    def _lessons_text(self, lessons):
+        return lessons.render(self.encoded, self.encoded_times)
+
+    def _object_text(self, texts):
+        """texts is already in key order (self.days is sorted)"""
+        encoded_keys = self.encoded_keys
+        return "{" + ",".join([encoded_keys[key] + ":" + text for key, text in texts.items()]) + "}"
+
+    def _day_texts(self, day_name):
+        return {
+            class_name: self._lessons_text(lessons)
+            for class_name, lessons in self.days.get(day_name, {}).items()
+        }
+
+    def render_lessons(self, day_name, class_name):
+        lessons = self.days.get(day_name, {}).get(class_name)
+        return (self._lessons_text(lessons) if lessons is not None else "[]").encode("utf-8")
+
+    def render_day(self, day_name):
+        return self._object_text(self._day_texts(day_name)).encode("utf-8")
+
+    def render(self):
+        return self._object_text({
+            day_name: self._object_text(self._day_texts(day_name)) for day_name in self.days
+        }).encode("utf-8")
+
+    def bodies(self):
+        """Yield (day_name, class_name, body) for every class, every day (class None)
+        and the whole week (None, None), composing each level from the one below."""
+        day_bodies = {}
+        for day_name in self.days:
+            class_texts = self._day_texts(day_name)
+            for class_name, text in class_texts.items():
+                yield day_name, class_name, text.encode("utf-8")
+            day_bodies[day_name] = self._object_text(class_texts)
+            yield day_name, None, day_bodies[day_name].encode("utf-8")
+        yield None, None, self._object_text(day_bodies).encode("utf-8")
+
+    def to_json(self):
+        return {
+            day_name: {
+                class_name: lessons.to_json(self.strings, self.para_times)
+                for class_name, lessons in classes.items()
+            }
+            for day_name, classes in self.days.items()
+        }
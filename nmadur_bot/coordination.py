@@ -0,0 +1,286 @@
+import asyncio
+import os
+import socket
+from datetime import timedelta
+
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from models import async_engine, get_async_db, JobRun
+from delivery import broadcast
+from metrics import IS_LEADER, SHARD_RUNS
+
+# --- Ko'p nusxali (replica) ishlash parametrlari ---
+# Nusxa nomi: job_runs.claimed_by va loglar uchun
+REPLICA_ID = os.getenv("REPLICA_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Har bir yuborish shuncha bo'lakka bo'linadi (abs(chat_id) % SHARD_COUNT); bo'laklarni nusxalar o'zaro bo'lishadi
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 4))
+# Lider qulfini olish / tekshirish oralig'i (sekund). Follower'lar shu oraliqda keshni sinxronlaydi
+LEADER_POLL_SECONDS = float(os.getenv("LEADER_POLL_SECONDS", 10))
+# Bo'sh bo'lak qidirish oralig'i va band qilingan bo'lak ijarasi (yuborish davomida yangilanib turadi)
+SHARD_POLL_SECONDS = float(os.getenv("SHARD_POLL_SECONDS", 2))
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", 60))
+# Bo'lak shuncha chatlik qismlarda yuboriladi; har qismdan keyin cursor saqlanadi
+SHARD_CHUNK_SIZE = int(os.getenv("SHARD_CHUNK_SIZE", 500))
+SHARD_MAX_ATTEMPTS = 3
+# Tugagan bo'laklar shuncha kun saqlanadi
+JOB_RUNS_RETENTION_DAYS = 7
+
+# pg_advisory_lock kaliti (butun klaster uchun bitta lider)
+LEADER_LOCK_KEY = 0x6E6D6164
+
+leader_connection = None  # qulf shu ulanish (Postgres sessiyasi) yopilguncha ushlab turiladi
+executors = {}            # kind -> async (args, shard, shard_count) -> (label, [(chat_id, text, parse_mode), ...])
+work_available = asyncio.Event()
+background_tasks = []
+
+
+def register_executor(kind, build_messages):
+    executors[kind] = build_messages
+
+
+def is_leader():
+    return leader_connection is not None
+
+
+# --- Lider tanlash (Postgres advisory lock) ---
+async def try_acquire_leadership():
+    global leader_connection
+    conn = await async_engine.connect()
+    try:
+        acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": LEADER_LOCK_KEY})
+        await conn.commit()
+    except Exception:
+        await conn.close()
+        raise
+    if not acquired:
+        await conn.close()
+        return False
+    leader_connection = conn
+    IS_LEADER.set(1)
+    print(f"👑 {REPLICA_ID} lider bo'ldi")
+    return True
+
+
+async def still_leader():
+    """Ping the lock's connection; if it is gone Postgres has already released the lock"""
+    try:
+        await leader_connection.scalar(text("SELECT 1"))
+        await leader_connection.commit()
+        return True
+    except Exception as e:
+        print(f"Lider ulanishi uzildi: {e}")
+        await resign_leadership()
+        return False
+
+
+async def resign_leadership():
+    """Drop the lock by discarding its connection (never returned to the pool while locked)"""
+    global leader_connection
+    conn, leader_connection = leader_connection, None
+    IS_LEADER.set(0)
+    if conn is None:
+        return
+    try:
+        await conn.invalidate()
+        await conn.close()
+    except Exception as e:
+        print(f"Lider ulanishini yopishda xato: {e}")
+
+
+async def run_leader_election(on_elected, on_demoted, on_follower_tick):
+    while True:
+        await asyncio.sleep(LEADER_POLL_SECONDS)
+        try:
+            if is_leader():
+                if await still_leader():
+                    await cleanup_runs()
+                else:
+                    await on_demoted()
+            elif await try_acquire_leadership():
+                await elected(on_elected)
+            else:
+                await on_follower_tick()
+        except Exception as e:
+            print(f"Lider tekshiruvida xato: {e}")
+
+
+async def elected(on_elected):
+    try:
+        await on_elected()
+    except Exception:
+        # Scheduler ishga tushmagan lider qulfni ushlab turmasligi kerak
+        await resign_leadership()
+        raise
+
+
+# --- Yuborish bo'laklari (job_runs) ---
+async def enqueue_run(kind, run_key, args=None, deadline=None):
+    """Create the SHARD_COUNT pending shards of one run. A run_key that already exists
+    (a second leader during failover, a re-fired job) creates nothing."""
+    rows = [
+        {
+            "run_key": run_key, "kind": kind, "args": args or {}, "shard": shard,
+            "shard_count": SHARD_COUNT, "deadline": deadline,
+        }
+        for shard in range(SHARD_COUNT)
+    ]
+    stmt = (
+        insert(JobRun.__table__)
+        .on_conflict_do_nothing(index_elements=[JobRun.run_key, JobRun.shard])
+        .returning(JobRun.id)
+    )
+    async with get_async_db() as db:
+        created = (await db.execute(stmt, rows)).all()
+        await db.commit()
+    if created:
+        work_available.set()
+        print(f"Yuborish navbatga qo'yildi: {run_key} ({len(created)} ta bo'lak)")
+    else:
+        print(f"Yuborish allaqachon navbatda: {run_key}")
+    return len(created)
+
+
+async def claim_shard():
+    """Take one pending or lease-expired shard; SKIP LOCKED keeps replicas off each other's rows"""
+    now = func.now()
+    claimable = (
+        select(JobRun.id)
+        .where(
+            or_(JobRun.status == "pending", and_(JobRun.status == "running", JobRun.lease_until < now)),
+            JobRun.attempts < SHARD_MAX_ATTEMPTS,
+            or_(JobRun.deadline.is_(None), JobRun.deadline > now),
+        )
+        .order_by(JobRun.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(JobRun)
+        .where(JobRun.id == claimable)
+        .values(
+            status="running", claimed_by=REPLICA_ID, attempts=JobRun.attempts + 1,
+            lease_until=now + timedelta(seconds=SHARD_LEASE_SECONDS),
+        )
+        .returning(JobRun.id, JobRun.run_key, JobRun.kind, JobRun.args, JobRun.shard, JobRun.shard_count, JobRun.cursor)
+    )
+    async with get_async_db() as db:
+        run = (await db.execute(stmt)).first()
+        await db.commit()
+    return run
+
+
+async def update_run(run_id, **values):
+    """Write to a shard only while this replica still owns it"""
+    async with get_async_db() as db:
+        await db.execute(
+            update(JobRun)
+            .where(JobRun.id == run_id, JobRun.claimed_by == REPLICA_ID)
+            .values(**values)
+        )
+        await db.commit()
+
+
+async def keep_lease(run_id):
+    while True:
+        await asyncio.sleep(SHARD_LEASE_SECONDS / 3)
+        try:
+            await update_run(run_id, lease_until=func.now() + timedelta(seconds=SHARD_LEASE_SECONDS))
+        except Exception as e:
+            print(f"Bo'lak ijarasini yangilashda xato ({run_id}): {e}")
+
+
+async def execute_shard(bot, run):
+    """Send one shard in chat_id order, checkpointing the cursor after every chunk"""
+    heartbeat = asyncio.create_task(keep_lease(run.id))
+    totals = dict.fromkeys(("total", "sent", "failed", "retried", "flood_waits"), 0)
+    status = "failed"
+    try:
+        label, messages = await executors[run.kind](run.args or {}, run.shard, run.shard_count)
+        label = f"{label} [{run.shard + 1}/{run.shard_count}]"
+        if run.cursor is not None:
+            # Oldingi nusxa shu chat_id gacha yuborib bo'lgan
+            messages = [message for message in messages if message[0] > run.cursor]
+        messages.sort(key=lambda message: message[0])
+        for start in range(0, len(messages), SHARD_CHUNK_SIZE):
+            chunk = messages[start:start + SHARD_CHUNK_SIZE]
+            stats = await broadcast(bot, chunk, label=label, kind=run.kind)
+            for key in totals:
+                totals[key] += stats[key]
+            await update_run(run.id, cursor=chunk[-1][0])
+        await update_run(run.id, status="done", finished_at=func.now(), stats=totals)
+        status = "done"
+    except Exception as e:
+        # Bo'lak 'running' holatida qoladi va ijara tugagach qayta olinadi (SHARD_MAX_ATTEMPTS gacha)
+        print(f"Bo'lakni yuborishda xato ({run.run_key} [{run.shard}]): {e}")
+    finally:
+        heartbeat.cancel()
+        SHARD_RUNS.labels(run.kind, status).inc()
+
+
+async def run_shard_worker(bot):
+    while True:
+        try:
+            run = await claim_shard()
+        except Exception as e:
+            print(f"Bo'lakni olishda xato: {e}")
+            run = None
+        if run is not None:
+            await execute_shard(bot, run)
+            continue
+        try:
+            await asyncio.wait_for(work_available.wait(), SHARD_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        work_available.clear()
+
+
+async def cleanup_runs():
+    """Leader housekeeping: close out shards past their deadline or out of attempts, drop old runs"""
+    now = func.now()
+    async with get_async_db() as db:
+        await db.execute(
+            update(JobRun)
+            .where(JobRun.status.in_(("pending", "running")), JobRun.deadline < now)
+            .values(status="expired", finished_at=now)
+        )
+        await db.execute(
+            update(JobRun)
+            .where(
+                JobRun.status == "running", JobRun.lease_until < now,
+                JobRun.attempts >= SHARD_MAX_ATTEMPTS,
+            )
+            .values(status="failed", finished_at=now)
+        )
+        await db.execute(
+            JobRun.__table__.delete()
+            .where(JobRun.created_at < now - timedelta(days=JOB_RUNS_RETENTION_DAYS))
+        )
+        await db.commit()
+
+
+# --- Ishga tushirish / to'xtatish ---
+async def start_coordination(bot, on_elected, on_demoted, on_follower_tick):
+    """Try to become leader right away (a lone replica starts exactly as before),
+    then keep electing and working shards in the background."""
+    try:
+        if await try_acquire_leadership():
+            await elected(on_elected)
+    except Exception as e:
+        print(f"Lider bo'lishda xato: {e}")
+    if not is_leader():
+        print(f"{REPLICA_ID} follower sifatida ishlayapti")
+    background_tasks.extend([
+        asyncio.create_task(run_leader_election(on_elected, on_demoted, on_follower_tick)),
+        asyncio.create_task(run_shard_worker(bot)),
+    ])
+
+
+async def stop_coordination():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await resign_leadership()
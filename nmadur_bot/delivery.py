@@ -0,0 +1,140 @@
+import asyncio
+import os
+import random
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from metrics import BROADCAST_MESSAGES, BROADCAST_QUEUE_DEPTH, BROADCAST_RATE
+
+# --- Yuborish parametrlari ---
+# Telegram limiti: umumiy ~30 xabar/s, bitta chatga ~1 xabar/s
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 16))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", 28))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", 1.0))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", 3))
+
+
+class TokenBucket:
+    """Async token bucket: at most `rate` acquisitions per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (used when Telegram answers 429)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Bir vaqtda ketayotgan barcha yuborishlar (kunlik jadval + eslatmalar) bitta limitga bo'ysunadi
+global_bucket = TokenBucket(BROADCAST_GLOBAL_RATE)
+chat_next_send = {}  # chat_id -> shu chatga keyingi xabar yuborilishi mumkin bo'lgan vaqt
+
+
+async def wait_for_chat(chat_id):
+    now = time.monotonic()
+    next_send = chat_next_send.get(chat_id, 0.0)
+    chat_next_send[chat_id] = max(now, next_send) + BROADCAST_PER_CHAT_INTERVAL
+    if next_send > now:
+        await asyncio.sleep(next_send - now)
+
+
+def prune_chat_limits():
+    now = time.monotonic()
+    for chat_id in [c for c, t in chat_next_send.items() if t <= now]:
+        del chat_next_send[chat_id]
+
+
+async def broadcast(bot, messages, label="broadcast", kind="broadcast", workers=BROADCAST_WORKERS):
+    """Send (chat_id, text, parse_mode) messages through a rate-limited worker queue.
+
+    Honors 429 retry_after, retries timeouts/network errors with backoff and
+    returns per-run stats. `kind` labels the run's metrics (daily, reminder).
+    """
+    queue = asyncio.Queue()
+    total = 0
+    for chat_id, text, parse_mode in messages:
+        queue.put_nowait((chat_id, text, parse_mode, 0))
+        total += 1
+
+    stats = {"label": label, "total": total, "sent": 0, "failed": 0, "retried": 0, "flood_waits": 0}
+    started = time.monotonic()
+    queue_depth = BROADCAST_QUEUE_DEPTH.labels(kind)
+    queue_depth.set(total)
+
+    def count(outcome):
+        stats[outcome] += 1
+        BROADCAST_MESSAGES.labels(kind, outcome).inc()
+
+    async def worker():
+        while True:
+            chat_id, text, parse_mode, attempt = await queue.get()
+            queue_depth.set(queue.qsize())
+            try:
+                await global_bucket.acquire()
+                await wait_for_chat(chat_id)
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                count("sent")
+            except RetryAfter as e:
+                count("flood_waits")
+                global_bucket.pause(e.retry_after)
+                requeue(chat_id, text, parse_mode, attempt, str(e))
+            except (BadRequest, Forbidden) as e:
+                # Bot bloklangan yoki chat topilmadi — qayta urinishdan foyda yo'q
+                count("failed")
+                print(f"{label} yuborishda xato ({chat_id}): {e}")
+            except NetworkError as e:
+                await asyncio.sleep(random.uniform(0, 2 ** attempt))
+                requeue(chat_id, text, parse_mode, attempt, str(e))
+            except Exception as e:
+                count("failed")
+                print(f"{label} yuborishda xato ({chat_id}): {e}")
+            finally:
+                queue.task_done()
+
+    def requeue(chat_id, text, parse_mode, attempt, error):
+        if attempt < BROADCAST_MAX_RETRIES:
+            count("retried")
+            queue.put_nowait((chat_id, text, parse_mode, attempt + 1))
+        else:
+            count("failed")
+            print(f"{label} yuborishda xato ({chat_id}): {error}, {attempt + 1} urinishdan keyin")
+
+    tasks = [asyncio.create_task(worker()) for _ in range(min(workers, total))]
+    try:
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        queue_depth.set(0)
+        prune_chat_limits()
+
+    duration = time.monotonic() - started
+    stats["duration_seconds"] = round(duration, 3)
+    stats["messages_per_second"] = round(stats["sent"] / duration, 2) if duration > 0 else 0.0
+    BROADCAST_RATE.labels(kind).set(stats["messages_per_second"])
+    print(
+        f"{label}: {stats['sent']}/{total} yuborildi, {stats['failed']} xato, "
+        f"{stats['retried']} qayta urinish — {duration:.2f} s ({stats['messages_per_second']} msg/s)"
+    )
+    return stats
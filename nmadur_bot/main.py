@@ -1,7 +1,10 @@
+import time
+# Ishga tushish vaqti importlardan oldin olinadi (bot_startup_seconds shundan hisoblanadi)
+STARTED_AT = time.monotonic()
+
 import os
 import logging
 import asyncio
-from datetime import datetime
 from zoneinfo import ZoneInfo
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
@@ -10,24 +13,67 @@ from telegram.ext import Application, CommandHandler, CallbackQueryHandler, Cont
 TASHKENT_TZ = ZoneInfo("Asia/Tashkent")
 
 # Ichki modullar
-from models import SessionLocal, Group, User, ScheduleCache
-from schedule_updater import start_scheduler, refresh_all_cache, set_application, has_real_lessons
+from sqlalchemy.dialects.postgresql import insert
+
+from models import get_async_db, async_engine, User
+from memory_cache import memory_cache
+from schedule_updater import (
+    set_application, close_http_session, today_date, start_warm_up, run_in_background,
+    stop_background_tasks, stop_scheduler, on_elected, on_demoted, sync_from_db,
+    current_para, find_teacher, find_free_rooms, LESSON_TIMES
+)
+from coordination import start_coordination, stop_coordination
+from rendering import LOOKUP_FAILED_TEXT, NOT_CACHED_TEXT, render_free_rooms, render_teacher
+from metrics import mark_startup, start_metrics_server, timed_handler
 
 # --- Bot token ---
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable topilmadi!")
 
+# Telegram Bot API manzili (benchmark uchun lokal soxta server berilishi mumkin)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+# --- Ishlash rejimi: "polling" (standart) yoki "webhook" ---
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Bir vaqtda ishlov beriladigan update'lar soni
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 32))
+
 # --- Logging ---
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
 
+async def on_ready(app: Application) -> None:
+    # Bot Telegram'ga ulandi, update'larni qabul qilishga tayyor
+    mark_startup("ready", STARTED_AT)
+
+async def on_shutdown(app: Application) -> None:
+    await stop_scheduler()
+    await stop_background_tasks()
+    await stop_coordination()
+    await close_http_session()
+    await async_engine.dispose()
+
 # --- Global Application obyektini yaratish ---
-application = Application.builder().token(BOT_TOKEN).build()
+application = (
+    Application.builder()
+    .token(BOT_TOKEN)
+    .base_url(TELEGRAM_API_BASE_URL)
+    .concurrent_updates(CONCURRENT_UPDATES)
+    .post_init(on_ready)
+    .post_shutdown(on_shutdown)
+    .build()
+)
 
 # --- Bot Funksiyalari ---
+def callback_type(update: Update) -> str:
+    """Metrics label of a callback query: degree, group or other"""
+    kind = (update.callback_query.data or "").split('_')[0]
+    return kind if kind in ("degree", "group") else "other"
+
+@timed_handler("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     keyboard = [
         [InlineKeyboardButton("1-kurs", callback_data='degree_1')],
@@ -42,17 +88,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         parse_mode='Markdown'
     )
 
+@timed_handler(callback_type)
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
     data = query.data
     chat_id = query.message.chat_id
-    db_session = SessionLocal()
 
     try:
         if data.startswith('degree_'):
             degree = int(data.split('_')[1])
-            groups = db_session.query(Group).filter(Group.degree == degree).all()
+            groups = await memory_cache.get_groups(degree)
             
             if not groups:
                 await query.edit_message_text(
@@ -60,7 +106,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 )
                 return
             
-            keyboard = [[InlineKeyboardButton(g.class_name, callback_data=f'group_{g.class_name}')] for g in groups]
+            keyboard = [[InlineKeyboardButton(g, callback_data=f'group_{g}')] for g in groups]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(
                 f"✅ **{degree}-kurs** tanlandi. Endi **guruhingizni** tanlang:", 
@@ -70,15 +116,16 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         elif data.startswith('group_'):
             class_name = data.split('_')[1]
-            user = db_session.query(User).filter(User.chat_id == chat_id).first()
-            if user:
-                user.class_name = class_name
-            else:
-                user = User(chat_id=chat_id, class_name=class_name)
-                db_session.add(user)
-            db_session.commit()
+            # Bitta so'rov: chat bo'lsa guruhi yangilanadi, bo'lmasa qo'shiladi
+            async with get_async_db() as db_session:
+                await db_session.execute(
+                    insert(User)
+                    .values(chat_id=chat_id, class_name=class_name)
+                    .on_conflict_do_update(index_elements=[User.chat_id], set_={"class_name": class_name})
+                )
+                await db_session.commit()
             
-            schedule_text = get_schedule_from_cache(db_session, class_name)
+            schedule_text = await get_schedule_from_cache(class_name)
             await query.edit_message_text(
                 f"🎉 **{class_name}** guruhi tanlandi. Bugungi dars jadvali:\n\n{schedule_text}", 
                 parse_mode='Markdown'
@@ -88,64 +135,88 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logging.error(f"button_handler da xato: {e}")
         await query.edit_message_text("🚫 Kechirasiz, xatolik yuz berdi. Iltimos, /start bosing.")
 
-    finally:
-        db_session.close()
+# --- O'qituvchi va bo'sh xonalar (API indekslari) ---
+@timed_handler("teacher")
+async def teacher_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/teacher <ism>: where the teacher has lessons today"""
+    name = " ".join(context.args)
+    if not name:
+        await update.message.reply_text("Foydalanish: /teacher <o'qituvchi ismi>")
+        return
+    day_name = today_date().strftime('%A')
+    data = await find_teacher(name, day_name)
+    if data is None:
+        await update.message.reply_text(LOOKUP_FAILED_TEXT)
+        return
+    text, parse_mode = render_teacher(name, day_name, data, current_para())
+    await update.message.reply_text(text, parse_mode=parse_mode)
+
+@timed_handler("free_rooms")
+async def free_rooms_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/free_rooms [para]: rooms without a lesson today in that para (default: the current one)"""
+    paras = [lesson['para'] for lesson in LESSON_TIMES]
+    if context.args:
+        para = int(context.args[0]) if context.args[0].isdigit() else None
+        if para not in paras:
+            await update.message.reply_text(f"Foydalanish: /free_rooms [para: {paras[0]}-{paras[-1]}]")
+            return
+    else:
+        para = current_para()
+        if para is None:
+            await update.message.reply_text("Bugungi paralar tugadi. Para raqamini yozing: /free_rooms 1")
+            return
+    data = await find_free_rooms(today_date().strftime('%A'), para)
+    if data is None:
+        await update.message.reply_text(LOOKUP_FAILED_TEXT)
+        return
+    text, parse_mode = render_free_rooms(data)
+    await update.message.reply_text(text, parse_mode=parse_mode)
 
 # --- Keshdan jadvalni olish funksiyasi ---
-def get_schedule_from_cache(session, class_name):
-    cache_entry = session.query(ScheduleCache).filter(ScheduleCache.class_name == class_name).first()
-    if not cache_entry:
-        return "⚠️ Jadval keshda topilmadi. Kesh yangilanishini kuting yoki administratorga murojaat qiling."
-    
-    schedule_data = cache_entry.data
-    # Use Asia/Tashkent timezone for day name
-    day_name = datetime.now(TASHKENT_TZ).strftime('%A')
-    
-    # Check if data is None or empty, or only has empty slots
-    if not has_real_lessons(schedule_data):
-        return "Bugun sizda dars mavjud emas"
-        
-    output = [f"📅 **Bugungi jadval ({day_name})** uchun **{class_name}**:\n"]
-    for item in schedule_data:
-        subject = item.get('subject', 'N/A')
-        # Skip empty slots in display
-        if subject in ['Bo\'sh', 'Bo\'sh kun']:
-            continue
-        output.append(
-            f"🔸 **{item.get('para', 'N/A')}**-para: **{item.get('time', 'N/A')}**\n"
-            f"📚 {subject} ({item.get('room', 'N/A')})\n"
-            f"👤 O'qituvchi: {item.get('teacher', 'N/A')}\n"
-            "---"
-        )
-    
-    return "\n".join(output)
+async def get_schedule_from_cache(class_name):
+    messages = await memory_cache.get_messages(class_name, today_date())
+    if messages is None:
+        return NOT_CACHED_TEXT
+    # Matn refresh paytida oldindan tayyorlangan
+    text, _ = messages["daily"]
+    return text
 
 # --- Handlerlarni qo'shish ---
 application.add_handler(CommandHandler("start", start))
+application.add_handler(CommandHandler("teacher", teacher_command))
+application.add_handler(CommandHandler("free_rooms", free_rooms_command))
 application.add_handler(CallbackQueryHandler(button_handler))
 
-# --- Scheduler ishga tushadi ---
-def start_bot_services():
-    start_scheduler()  # schedule_updater ichidagi scheduler ishga tushadi
+# --- Scheduler va yuborish xizmatlari ---
+async def start_bot_services():
+    """Leader election: the leader runs the scheduler and the refreshes; every replica sends its share of deliveries.
+
+    Nothing here is awaited: the warm-up, the election and the leader's refresh
+    run in the background while the bot already answers from the database.
+    """
+    start_warm_up().add_done_callback(lambda _: mark_startup("warm_up", STARTED_AT))
+    run_in_background(start_coordination(application.bot, on_elected, on_demoted, sync_from_db))
 
 def main():
     logging.info("⏳ Bot ishga tushmoqda...")
+    mark_startup("imports", STARTED_AT)
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
     set_application(application)
-    start_bot_services()
-    logging.info("✅ Scheduler xizmatlari ishga tushirildi")
-
-    try:
-        loop.run_until_complete(refresh_all_cache())
-        logging.info("✅ Kesh muvaffaqiyatli yangilandi")
-    except Exception as e:
-        logging.error(f"Keshni yangilashda xato: {e}")
-
-    logging.info("🤖 Bot polling-ni boshlayapti...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    start_metrics_server()
+    # Keshni yuklash, lider tanlash va yangilash polling bilan parallel ketadi
+    loop.run_until_complete(start_bot_services())
+    logging.info("✅ Scheduler xizmatlari fonda ishga tushirilmoqda")
+
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        logging.info("🤖 Bot webhook rejimida ishga tushmoqda...")
+        loop.run_until_complete(run_webhook(application))
+    else:
+        logging.info("🤖 Bot polling-ni boshlayapti...")
+        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from models import get_async_db, Group, ScheduleCache
+from rendering import render_messages
+
+# Xotirada saqlanadigan (guruh, sana) jadvallari soni; to'lsa eng uzoq kunlar chiqariladi,
+# bugungi jadvallar esa hech qachon (ular bu chegaraga kirmaydi)
+SCHEDULE_MEMORY_MAX_CLASSES = int(os.getenv("SCHEDULE_MEMORY_MAX_CLASSES", 2000))
+SCHEDULE_MEMORY_MAX_ENTRIES = int(os.getenv("SCHEDULE_MEMORY_MAX_ENTRIES", SCHEDULE_MEMORY_MAX_CLASSES * 7))
+# Ishga tushishda matnlar shuncha jadvallik bo'laklarda tayyorlanadi; oraliqda bot update'larga javob beradi
+WARM_UP_CHUNK_SIZE = 100
+
+
+class ScheduleMemoryCache:
+    """Read-through, in-process copy of schedule_cache and of the degree -> groups list.
+
+    Schedules are keyed by (class_name, schedule_date). Filled on startup,
+    updated by the refresher. Past `max_entries`, days before today go first,
+    then the furthest-ahead day (least recently used class first); today's
+    schedules are never evicted, since every send path reads them. A missing cache row is
+    remembered as None so it does not hit the database on every button press
+    either. Every stored schedule also gets its final message texts rendered
+    once (see rendering.render_messages), so send paths only look them up.
+    """
+
+    def __init__(self, max_entries=SCHEDULE_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._schedules = {}             # (class_name, schedule_date) -> lessons (yoki None)
+        self._dates = {}                 # schedule_date -> OrderedDict of keys (LRU tartibida)
+        self._messages = {}              # (class_name, schedule_date) -> {kind: (text, parse_mode)}
+        self._groups = None              # degree -> [class_name, ...]
+        self._today = None               # bu sanadagi jadvallar chiqarilmaydi
+
+    async def load_from_db(self, from_date):
+        """Load from_date's schedules in full, then the following days in date order up to max_entries."""
+        self._today = from_date
+        columns = (ScheduleCache.class_name, ScheduleCache.schedule_date, ScheduleCache.data)
+        async with get_async_db() as db:
+            entries = (await db.execute(select(*columns).where(ScheduleCache.schedule_date == from_date))).all()
+            entries += (await db.execute(
+                select(*columns)
+                .where(ScheduleCache.schedule_date > from_date)
+                .order_by(ScheduleCache.schedule_date, ScheduleCache.class_name)
+                .limit(max(0, self.max_entries - len(entries)))
+            )).all()
+            groups = (await db.execute(select(Group.degree, Group.class_name).order_by(Group.id))).all()
+        self.set_groups(groups)
+        for start in range(0, len(entries), WARM_UP_CHUNK_SIZE):
+            self.update_schedules({
+                (class_name, day): data for class_name, day, data in entries[start:start + WARM_UP_CHUNK_SIZE]
+            })
+            await asyncio.sleep(0)
+        print(f"Xotira keshi yuklandi: {len(entries)} ta jadval, {len(groups)} ta guruh")
+
+    async def get_schedule(self, class_name, schedule_date):
+        key = (class_name, schedule_date)
+        if key in self._schedules:
+            self._dates[schedule_date].move_to_end(key)
+            return self._schedules[key]
+        async with get_async_db() as db:
+            data = await db.scalar(
+                select(ScheduleCache.data)
+                .where(ScheduleCache.class_name == class_name, ScheduleCache.schedule_date == schedule_date)
+            )
+        # So'rov davomida refresh yangiroq qiymat yozgan bo'lishi mumkin
+        if key in self._schedules:
+            return self._schedules[key]
+        self._put(key, data)
+        return data
+
+    async def get_messages(self, class_name, schedule_date):
+        """Pre-rendered messages of one class and day, or None if it is not cached."""
+        await self.get_schedule(class_name, schedule_date)
+        return self._messages.get((class_name, schedule_date))
+
+    def holds(self, key, data):
+        """True if key is cached with exactly this data (no LRU touch)."""
+        return key in self._schedules and self._schedules[key] == data
+
+    def peek(self, key):
+        """(True, lessons) if key is cached, else (False, None); no LRU touch."""
+        if key in self._schedules:
+            return True, self._schedules[key]
+        return False, None
+
+    def update_schedules(self, schedules):
+        """Apply {(class_name, schedule_date): lessons} in one step (no await in between)."""
+        for key, data in schedules.items():
+            self._put(key, data)
+
+    def prune(self, before_date):
+        """Drop every entry older than before_date, which becomes the day that is never evicted."""
+        self._today = before_date
+        for schedule_date in [day for day in self._dates if day < before_date]:
+            for key in self._dates.pop(schedule_date):
+                del self._schedules[key]
+                self._messages.pop(key, None)
+
+    def _put(self, key, data):
+        self._schedules[key] = data
+        keys = self._dates.setdefault(key[1], OrderedDict())
+        keys[key] = None
+        keys.move_to_end(key)
+        if data is None:
+            self._messages.pop(key, None)
+        else:
+            self._messages[key] = render_messages(key[0], key[1], data)
+        while len(self._schedules) > self.max_entries:
+            schedule_date = self._eviction_date()
+            if schedule_date is None:
+                break
+            keys = self._dates[schedule_date]
+            evicted, _ = keys.popitem(last=False)
+            if not keys:
+                del self._dates[schedule_date]
+            del self._schedules[evicted]
+            self._messages.pop(evicted, None)
+
+    def _eviction_date(self):
+        """Day to evict from: a past day if any, else the furthest-ahead day; never today."""
+        if self._today is None:
+            return max(self._dates)
+        past = [day for day in self._dates if day < self._today]
+        if past:
+            return min(past)
+        ahead = [day for day in self._dates if day > self._today]
+        return max(ahead) if ahead else None
+
+    async def get_groups(self, degree):
+        if self._groups is None:
+            async with get_async_db() as db:
+                self.set_groups((await db.execute(select(Group.degree, Group.class_name).order_by(Group.id))).all())
+        return self._groups.get(degree, [])
+
+    async def all_class_names(self):
+        if self._groups is None:
+            await self.get_groups(None)
+        return [class_name for class_names in self._groups.values() for class_name in class_names]
+
+    def set_groups(self, rows):
+        """Replace the degree -> groups map from (degree, class_name) rows."""
+        groups = {}
+        for degree, class_name in rows:
+            groups.setdefault(degree, []).append(class_name)
+        self._groups = groups
+
+
+memory_cache = ScheduleMemoryCache()
@@ -0,0 +1,162 @@
+import contextvars
+import functools
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy import event
+
+# Prometheus exporter porti (0 — o'chirilgan)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9091))
+# Har bir span JSON qator sifatida stdout ga yoziladi ("0" — o'chirilgan)
+TRACE_SPANS = os.getenv("TRACE_SPANS", "1") == "1"
+# API ga shu sarlavhada trace id yuboriladi (API o'z span'larini shu id bilan yozadi)
+REQUEST_ID_HEADER = "X-Request-ID"
+
+trace_id_var = contextvars.ContextVar("trace_id", default=None)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Update handler latency by command / callback type",
+    ["callback"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+DB_QUERY_SECONDS = Histogram(
+    "bot_db_query_seconds", "Database statement time by statement type",
+    ["statement"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+API_REQUEST_SECONDS = Histogram(
+    "bot_api_request_seconds", "Schedule API call latency (one attempt)",
+    ["path", "status"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+REFRESH_SHEET_SECONDS = Histogram(
+    "bot_refresh_sheet_seconds", "Week-ahead refresh of one spreadsheet (API call + DB write)",
+    ["spreadsheet_id", "sheet", "result"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REFRESH_ROWS_WRITTEN = Counter(
+    "bot_refresh_rows_written_total", "Changed (class, date) rows written by refreshes",
+    ["spreadsheet_id", "sheet"]
+)
+REFRESH_LESSONS_CHANGED = Counter(
+    "bot_refresh_lessons_changed_total", "Changed (class, date, para) lessons found by refreshes",
+    ["spreadsheet_id", "sheet"]
+)
+REFRESH_RUN_SECONDS = Histogram(
+    "bot_refresh_run_seconds", "Full refresh_all_cache run",
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+BROADCAST_QUEUE_DEPTH = Gauge("bot_broadcast_queue_depth", "Messages waiting in the broadcast queue", ["kind"])
+BROADCAST_MESSAGES = Counter(
+    "bot_broadcast_messages_total", "Broadcast messages by outcome (sent, failed, retried, flood_waits)",
+    ["kind", "outcome"]
+)
+BROADCAST_RATE = Gauge("bot_broadcast_messages_per_second", "Send rate of the last finished broadcast", ["kind"])
+JOB_LAG_SECONDS = Histogram(
+    "bot_scheduler_job_lag_seconds", "Delay between a job's scheduled time and its submission",
+    ["job"], buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300)
+)
+JOB_EVENTS = Counter("bot_scheduler_job_events_total", "Scheduler job outcomes (executed, error, missed)", ["job", "event"])
+IS_LEADER = Gauge("bot_is_leader", "1 while this replica holds the leader lock and runs the scheduler")
+SHARD_RUNS = Counter("bot_shard_runs_total", "Delivery shards handled by this replica by outcome", ["kind", "status"])
+STARTUP_SECONDS = Gauge(
+    "bot_startup_seconds", "Seconds from process start to each startup phase (imports, ready, warm_up)", ["phase"]
+)
+
+
+def start_metrics_server():
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"📈 Metrikalar: :{METRICS_PORT}/metrics")
+
+
+def mark_startup(phase, started):
+    """Record and log how long after `started` (time.monotonic() at process start) a startup phase was reached"""
+    elapsed = time.monotonic() - started
+    STARTUP_SECONDS.labels(phase).set(elapsed)
+    print(f"⏱ Ishga tushish: {phase} — {elapsed:.3f} s")
+    return elapsed
+
+
+def timed_handler(label):
+    """Decorator: record a PTB handler's latency in bot_handler_seconds.
+
+    `label` is a fixed string or a function of the update (e.g. the callback type).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                return await handler(update, context)
+            finally:
+                HANDLER_SECONDS.labels(label(update) if callable(label) else label).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine):
+    """Time every statement run through engine (sync or async) into bot_db_query_seconds"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.labels(statement.split(None, 1)[0].upper()).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute chaqirilmaydi — boshlanish vaqti tashlab yuboriladi
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+def observe_scheduler(scheduler):
+    """Record job lag, runs, errors and misfires of an APScheduler scheduler"""
+    names = {EVENT_JOB_EXECUTED: "executed", EVENT_JOB_ERROR: "error", EVENT_JOB_MISSED: "missed"}
+
+    def listener(job_event):
+        if job_event.code == EVENT_JOB_SUBMITTED:
+            lag = (datetime.now(timezone.utc) - max(job_event.scheduled_run_times)).total_seconds()
+            JOB_LAG_SECONDS.labels(job_event.job_id).observe(max(lag, 0.0))
+        else:
+            JOB_EVENTS.labels(job_event.job_id, names[job_event.code]).inc()
+
+    scheduler.add_listener(listener, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+
+def current_trace_id():
+    return trace_id_var.get()
+
+
+@contextmanager
+def span(name, root=False, **attrs):
+    """Time a block and log it as one JSON line tagged with the current trace id.
+
+    Starts a new trace when root=True or when no trace is active, so one
+    refresh run, its API calls (X-Request-ID) and its DB writes share an id.
+    Yields the attribute dict, so the block can add fields (status, rows, ...).
+    """
+    token = trace_id_var.set(uuid.uuid4().hex[:16]) if root or trace_id_var.get() is None else None
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        attrs["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if TRACE_SPANS:
+            print(json.dumps(
+                {"span": name, "trace_id": trace_id_var.get(), **attrs},
+                ensure_ascii=False, default=str
+            ))
+        if token is not None:
+            trace_id_var.reset(token)
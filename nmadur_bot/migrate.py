@@ -0,0 +1,12 @@
+"""Apply the database schema (tables and SCHEMA_UPGRADES) once per deploy.
+
+    python migrate.py
+"""
+import time
+
+from models import migrate
+
+if __name__ == "__main__":
+    started = time.monotonic()
+    migrate()
+    print(f"✅ Baza sxemasi yangilandi ({time.monotonic() - started:.2f} s)")
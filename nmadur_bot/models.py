@@ -1,29 +1,60 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, JSON
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, JSON, Date, DateTime, Index, func, text
 from sqlalchemy.orm import sessionmaker, declarative_base
-from contextlib import contextmanager
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from contextlib import contextmanager, asynccontextmanager
+
+from metrics import instrument_engine
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# --- Connection pool parametrlari (har bir deploy uchun alohida sozlanadi) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+
+def async_database_url(url):
+    """postgresql://... -> postgresql+asyncpg://... for the async engine"""
+    scheme, _, rest = url.partition("://")
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgres") else url
+
 engine = create_engine(
     DATABASE_URL,
-    pool_size=10,
-    max_overflow=20,
-    pool_timeout=30,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+
+# Bot coroutine'lari faqat shu engine orqali ishlaydi — event loop bloklanmaydi
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
 )
+instrument_engine(async_engine)
 
 Base = declarative_base()
 
 class Group(Base):
     __tablename__ = 'groups'
+    __table_args__ = (
+        Index('ix_groups_class_name', 'class_name', unique=True),
+    )
     id = Column(Integer, primary_key=True)
     degree = Column(Integer, nullable=False)
-    class_name = Column(String, unique=True, nullable=False)
+    class_name = Column(String, nullable=False)
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_chat_id', 'chat_id', unique=True),
+        # Har bir eslatma va kunlik yuborish class_name bo'yicha qidiradi
+        Index('ix_users_class_name', 'class_name'),
+    )
     id = Column(Integer, primary_key=True)
-    chat_id = Column(Integer, unique=True, nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
     class_name = Column(String)
 
 class Spreadsheet(Base):
@@ -35,11 +66,102 @@ class Spreadsheet(Base):
 
 class ScheduleCache(Base):
     __tablename__ = 'schedule_cache'
+    __table_args__ = (
+        Index('ix_schedule_cache_class_date', 'class_name', 'schedule_date', unique=True),
+        Index('ix_schedule_cache_updated_at', 'updated_at'),
+    )
     id = Column(Integer, primary_key=True)
-    class_name = Column(String, unique=True, nullable=False)
+    class_name = Column(String, nullable=False)
+    schedule_date = Column(Date, nullable=False)
     data = Column(JSON)
+    etag = Column(String)
+    # Lider yozganda yangilanadi; boshqa nusxalar xotira keshini shu bo'yicha sinxronlaydi
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
-Base.metadata.create_all(engine)
+class ScheduleChange(Base):
+    """One para of one (class, date) that a refresh found changed.
+
+    `before` / `after` hold that para's lessons before and after the refresh
+    ([] when it had none). Only rows that already existed are diffed, so the
+    first load of a day records nothing.
+    """
+    __tablename__ = 'schedule_changes'
+    __table_args__ = (
+        Index('ix_schedule_changes_class_date', 'class_name', 'schedule_date'),
+    )
+    id = Column(Integer, primary_key=True)
+    class_name = Column(String, nullable=False)
+    schedule_date = Column(Date, nullable=False)
+    para = Column(Integer, nullable=False)
+    before = Column(JSON)
+    after = Column(JSON)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class JobRun(Base):
+    """One chat_id shard of one scheduled delivery (daily schedule, para reminder).
+
+    The leader inserts SHARD_COUNT rows per run; any replica claims a pending
+    (or lease-expired) row, sends to chats with abs(chat_id) % shard_count == shard
+    and stores the last chat_id sent as `cursor`, so a reclaimed shard resumes there.
+    """
+    __tablename__ = 'job_runs'
+    __table_args__ = (
+        Index('ix_job_runs_run_shard', 'run_key', 'shard', unique=True),
+        Index('ix_job_runs_status', 'status'),
+    )
+    id = Column(Integer, primary_key=True)
+    run_key = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    args = Column(JSON)
+    shard = Column(Integer, nullable=False)
+    shard_count = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default='pending')  # pending, running, done, expired, failed
+    claimed_by = Column(String)
+    lease_until = Column(DateTime(timezone=True))
+    attempts = Column(Integer, nullable=False, default=0)
+    cursor = Column(BigInteger)
+    deadline = Column(DateTime(timezone=True))
+    stats = Column(JSON)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+# create_all mavjud jadvallarga yangi ustunlarni qo'shmaydi — ular shu yerda
+SCHEMA_UPGRADES = [
+    "ALTER TABLE schedule_cache ADD COLUMN IF NOT EXISTS etag VARCHAR",
+    # Kesh (class_name, schedule_date) bo'yicha: sanasiz eski qatorlar keyingi refresh'da qayta yoziladi
+    "ALTER TABLE schedule_cache ADD COLUMN IF NOT EXISTS schedule_date DATE",
+    "ALTER TABLE schedule_cache DROP CONSTRAINT IF EXISTS schedule_cache_class_name_key",
+    "DELETE FROM schedule_cache WHERE schedule_date IS NULL",
+    "ALTER TABLE schedule_cache ALTER COLUMN schedule_date SET NOT NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_schedule_cache_class_date ON schedule_cache (class_name, schedule_date)",
+    # seed.sql jadvallari cheklovsiz yaratilgan: avval dublikatlar tozalanadi
+    # (chat uchun oxirgi tanlov, guruh uchun birinchi qator qoladi)
+    "DELETE FROM users a USING users b WHERE a.chat_id = b.chat_id AND a.id < b.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_chat_id ON users (chat_id)",
+    "ALTER TABLE users DROP CONSTRAINT IF EXISTS users_chat_id_key",
+    # Telegram chat id'lari 2^31 dan oshadi (guruhlar -100..., yangi foydalanuvchilar)
+    "ALTER TABLE users ALTER COLUMN chat_id TYPE BIGINT",
+    "CREATE INDEX IF NOT EXISTS ix_users_class_name ON users (class_name)",
+    "DELETE FROM groups a USING groups b WHERE a.class_name = b.class_name AND a.id > b.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_groups_class_name ON groups (class_name)",
+    "ALTER TABLE groups DROP CONSTRAINT IF EXISTS groups_class_name_key",
+    "ALTER TABLE schedule_cache ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "CREATE INDEX IF NOT EXISTS ix_schedule_cache_updated_at ON schedule_cache (updated_at)",
+]
+
+def upgrade_schema():
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
+
+def migrate():
+    """Create missing tables and apply SCHEMA_UPGRADES.
+
+    Run once per deploy (`python migrate.py`), not on every import: the bot
+    starts without touching the schema.
+    """
+    Base.metadata.create_all(engine)
+    upgrade_schema()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -51,3 +173,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+@asynccontextmanager
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,158 @@
+EMPTY_SUBJECTS = ['Bo\'sh', 'Bo\'sh kun']
+NO_LESSONS_TEXT = "Bugun sizda dars mavjud emas"
+NOT_CACHED_TEXT = "⚠️ Jadval keshda topilmadi. Kesh yangilanishini kuting yoki administratorga murojaat qiling."
+LOOKUP_FAILED_TEXT = "⚠️ Jadval serveri javob bermadi. Birozdan keyin qayta urinib ko'ring."
+# Bitta xabarda ko'rsatiladigan bo'sh xonalar soni (Telegram xabari 4096 belgigacha)
+MAX_LISTED_ROOMS = 300
+# O'zgarish xabarida ko'rsatiladigan paralar soni (qolgani "va yana N ta")
+MAX_CHANGE_LINES = 15
+
+
+def has_real_lessons(schedule_data):
+    """Check if schedule has real lessons (not just Bo'sh or empty)"""
+    if not schedule_data:
+        return False
+
+    for item in schedule_data:
+        subject = item.get('subject', '')
+        if subject and subject not in EMPTY_SUBJECTS:
+            return True
+    return False
+
+
+def lessons_by_para(schedule_data):
+    """{para: [lesson, ...]} of the real lessons (no Bo'sh / empty subjects)"""
+    paras = {}
+    for lesson in schedule_data or []:
+        subject = lesson.get('subject')
+        if not subject or subject in EMPTY_SUBJECTS:
+            continue
+        try:
+            para = int(lesson.get('para'))
+        except (TypeError, ValueError):
+            continue
+        paras.setdefault(para, []).append(lesson)
+    return paras
+
+
+def changed_paras(old_data, new_data):
+    """{para: (lessons before, lessons after)} of every para whose real lessons differ"""
+    old, new = lessons_by_para(old_data), lessons_by_para(new_data)
+    return {
+        para: (old.get(para, []), new.get(para, []))
+        for para in sorted(old.keys() | new.keys())
+        if old.get(para) != new.get(para)
+    }
+
+
+def render_daily(class_name, day_name, schedule_data):
+    """Return (text, parse_mode) of the daily schedule message for one class"""
+    if not has_real_lessons(schedule_data):
+        return NO_LESSONS_TEXT, None
+
+    output = [f"📅 **Bugungi jadval ({day_name})** uchun **{class_name}**:\n"]
+    for item in schedule_data:
+        subject = item.get('subject', 'N/A')
+        # Skip empty slots in the output
+        if subject in EMPTY_SUBJECTS:
+            continue
+        output.append(
+            f"🔸 **{item.get('para', 'N/A')}**-para: **{item.get('time', 'N/A')}**\n"
+            f"📚 {subject} ({item.get('room', 'N/A')})\n"
+            f"👤 O'qituvchi: {item.get('teacher', 'N/A')}\n"
+            "---"
+        )
+    return "\n".join(output), 'Markdown'
+
+
+def render_reminder(class_name, lesson):
+    return (
+        f"🔔 **ESLATMA (10 daqiqadan so'ng): {class_name}**\n\n"
+        f"🔸 **{lesson.get('para', 'N/A')}**-juft: **{lesson.get('time', 'N/A')}**\n"
+        f"📚 Fan: **{lesson.get('subject', 'N/A')}**\n"
+        f"🚪 Xona: {lesson.get('room', 'N/A')}\n"
+        f"👤 O'qituvchi: {lesson.get('teacher', 'N/A')}"
+    )
+
+
+def render_messages(class_name, schedule_date, schedule_data):
+    """Render every message a (class, day) can need, once per refresh.
+
+    Returns {"daily": (text, parse_mode), ("reminder", para): (text, parse_mode), ...};
+    reminders exist only for paras with a real lesson (first lesson of the para wins).
+    """
+    messages = {"daily": render_daily(class_name, schedule_date.strftime('%A'), schedule_data)}
+    for lesson in schedule_data or []:
+        try:
+            para = int(lesson.get('para'))
+        except (TypeError, ValueError):
+            continue
+        subject = lesson.get('subject')
+        if ("reminder", para) in messages or not subject or subject in EMPTY_SUBJECTS:
+            continue
+        messages[("reminder", para)] = (render_reminder(class_name, lesson), 'Markdown')
+    return messages
+
+
+def describe_lessons(lessons):
+    return "; ".join(
+        f"{lesson.get('subject', 'N/A')} ({lesson.get('room') or 'N/A'}, {lesson.get('teacher') or 'N/A'})"
+        for lesson in lessons
+    )
+
+
+def render_changes(class_name, changes):
+    """Return (text, parse_mode) of a "schedule changed" message.
+
+    changes: [(schedule_date, para, before, after), ...] of one class, where
+    before / after are that para's lesson lists.
+    """
+    output = [f"✏️ **Jadval o'zgardi: {class_name}**"]
+    day = None
+    for schedule_date, para, before, after in sorted(changes, key=lambda change: change[:2])[:MAX_CHANGE_LINES]:
+        if schedule_date != day:
+            day = schedule_date
+            output.append(f"\n📅 {schedule_date.strftime('%A')} ({schedule_date.strftime('%d.%m')}):")
+        if not after:
+            output.append(f"🔸 **{para}**-para: ❌ {describe_lessons(before)} — bekor qilindi")
+        elif not before:
+            output.append(f"🔸 **{para}**-para: ➕ {describe_lessons(after)}")
+        else:
+            output.append(f"🔸 **{para}**-para: {describe_lessons(before)} → {describe_lessons(after)}")
+    if len(changes) > MAX_CHANGE_LINES:
+        output.append(f"\n... va yana {len(changes) - MAX_CHANGE_LINES} ta o'zgarish")
+    return "\n".join(output), 'Markdown'
+
+
+def render_teacher(query, day_name, data, now_para=None):
+    """Return (text, parse_mode) of a /teacher answer: the teacher's lessons on day_name"""
+    if not data["teacher"]:
+        if data["matches"]:
+            names = "\n".join(f"• {name}" for name in data["matches"])
+            return f"🔎 \"{query}\" topilmadi. Balki:\n{names}", None
+        return f"🔎 \"{query}\" ismli o'qituvchi topilmadi", None
+
+    if not data["lessons"]:
+        return f"👤 **{data['teacher']}** — {day_name} kuni darsi yo'q", 'Markdown'
+
+    output = [f"👤 **{data['teacher']}** — {day_name}:\n"]
+    for lesson in data["lessons"]:
+        marker = " ⬅️ hozir" if lesson["para"] == now_para else ""
+        output.append(
+            f"🔸 **{lesson['para']}**-para: **{lesson['time']}**{marker}\n"
+            f"🚪 Xona: {lesson['room'] or 'N/A'}\n"
+            f"📚 {lesson['subject']} ({', '.join(lesson['classes'])})"
+        )
+    return "\n".join(output), 'Markdown'
+
+
+def render_free_rooms(data):
+    """Return (text, parse_mode) of a /free_rooms answer"""
+    title = f"🚪 **{data['day']}, {data['para']}-para ({data['time']})**"
+    rooms = data["rooms"]
+    if not rooms:
+        return f"{title}: bo'sh xona yo'q", 'Markdown'
+    listed = ", ".join(rooms[:MAX_LISTED_ROOMS])
+    if len(rooms) > MAX_LISTED_ROOMS:
+        listed += f" va yana {len(rooms) - MAX_LISTED_ROOMS} ta"
+    return f"{title} — bo'sh xonalar ({len(rooms)} ta):\n{listed}", 'Markdown'
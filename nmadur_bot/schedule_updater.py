@@ -1,17 +1,69 @@
 import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-import aiohttp
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+import hashlib
+import importlib
+import json
 import os
+import random
+import time
 
-from models import get_db, User, Group, Spreadsheet, ScheduleCache
+from sqlalchemy import select, delete, func, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import engine, get_async_db, User, Group, Spreadsheet, ScheduleCache, ScheduleChange
+from delivery import broadcast
+import coordination
+from metrics import (
+    API_REQUEST_SECONDS, REFRESH_LESSONS_CHANGED, REFRESH_ROWS_WRITTEN, REFRESH_RUN_SECONDS, REFRESH_SHEET_SECONDS,
+    REQUEST_ID_HEADER, current_trace_id, observe_scheduler, span
+)
+from memory_cache import memory_cache
+from rendering import changed_paras, render_changes, NO_LESSONS_TEXT
 
 # Uzbekistan timezone
 TASHKENT_TZ = ZoneInfo("Asia/Tashkent")
 
 application = None  # bu main.py dan beriladi
-scheduler = AsyncIOScheduler(timezone=TASHKENT_TZ)
+
+class EventLoopExecutor(AsyncIOExecutor):
+    """AsyncIOExecutor for a scheduler that runs in its own thread.
+
+    AsyncIOExecutor takes its loop from the scheduler and must be called on
+    it; here the loop is given explicitly and every call from the scheduler
+    thread is handed over to it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None  # start_scheduler beradi
+
+    def start(self, scheduler, alias):
+        # AsyncIOExecutor.start loop'ni scheduler._eventloop dan oladi (BackgroundScheduler'da u yo'q)
+        scheduler._eventloop = self.loop
+        super().start(scheduler, alias)
+
+    def _do_submit_job(self, job, run_times):
+        self._eventloop.call_soon_threadsafe(super()._do_submit_job, job, run_times)
+
+    def shutdown(self, wait=True):
+        self._eventloop.call_soon_threadsafe(super().shutdown, wait)
+
+# Job'lar bazada saqlanadi: lider qayta ishga tushsa yoki almashsa, o'tkazib yuborilgan
+# ishga tushishlar misfire_grace_time ichida bajariladi. Scheduler faqat liderda ishlaydi.
+# Job store (sinxron engine) bilan ishlash scheduler'ning o'z thread'ida bo'ladi, event loop
+# bloklanmaydi; job'larning o'zi EventLoopExecutor orqali bot loop'ida bajariladi.
+job_executor = EventLoopExecutor()
+scheduler = BackgroundScheduler(
+    timezone=TASHKENT_TZ,
+    jobstores={"default": SQLAlchemyJobStore(engine=engine, tablename="apscheduler_jobs")},
+    executors={"default": job_executor}
+)
 
 def set_application(app):
     """Set the telegram application instance for sending notifications"""
@@ -28,225 +80,775 @@ LESSON_TIMES = [
     {"para": 7, "start": "18:00"},
 ]
 
+# Bitta para davomiyligi ("hozirgi para" ni aniqlash uchun)
+LESSON_DURATION = timedelta(minutes=80)
 REMINDER_OFFSET_MINUTES = 4
-lock = asyncio.Lock()
-
-def has_real_lessons(schedule_data):
-    """Check if schedule has real lessons (not just Bo'sh or empty)"""
-    if not schedule_data:
-        return False
-    
-    for item in schedule_data:
-        subject = item.get('subject', '')
-        if subject and subject not in ['Bo\'sh', 'Bo\'sh kun']:
-            return True
-    return False
+# Kunlik jadval shuncha kechiksa ham yuboriladi (qayta ishga tushish, lider almashishi);
+# eslatma esa para boshlanganidan keyin shu vaqtgacha
+DAILY_SEND_GRACE = timedelta(hours=3)
+REMINDER_SEND_GRACE = timedelta(minutes=15)
+# Keshda oldindan saqlanadigan kunlar soni (bugun + keyingi kunlar)
+WEEK_AHEAD_DAYS = int(os.getenv("WEEK_AHEAD_DAYS", 7))
+# Har bir jadval qancha vaqtda bir qayta tekshiriladi (0 — o'chirilgan)
+REFRESH_INTERVAL_MINUTES = int(os.getenv("REFRESH_INTERVAL_MINUTES", 15))
+# Fon refresher'i shu oraliqda ko'pi bilan bitta jadvalni tekshiradi
+REVALIDATE_TICK_SECONDS = int(os.getenv("REVALIDATE_TICK_SECONDS", 60))
+# Refresh o'zgargan darslarni topsa, shu guruhlar foydalanuvchilariga qisqa xabar yuboriladi ("0" — o'chirilgan)
+NOTIFY_SCHEDULE_CHANGES = os.getenv("NOTIFY_SCHEDULE_CHANGES", "1") == "1"
+# O'zgarish xabari navbatga qo'yilgandan keyin shu vaqtgacha yuboriladi
+CHANGE_SEND_GRACE = timedelta(hours=1)
+
+# --- Refresh engine parametrlari ---
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", 4))
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", 30))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", 3))
+API_RETRY_BASE_SECONDS = float(os.getenv("API_RETRY_BASE_SECONDS", 0.5))
+# /teacher, /free_rooms: refresh navbatidan tashqari, bitta urinish, qisqa timeout
+LOOKUP_TIMEOUT_SECONDS = float(os.getenv("LOOKUP_TIMEOUT_SECONDS", 5))
+
+http_session = None  # barcha API so'rovlari uchun bitta keep-alive ClientSession
+lookup_session = None  # foydalanuvchi qidiruvlari uchun alohida session (refresh ulanishlarini kutmaydi)
+refresh_semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+refresh_locks = {}  # (spreadsheet_id, sheet_name) -> asyncio.Lock
+
+# (spreadsheet_id, sheet_name) -> (ETag, {day_name: {class_name: lessons}}) oxirgi /schedule/week javobi
+week_payloads = {}
+# (spreadsheet_id, sheet_name) -> [class_name, ...] va oxirgi tekshirilgan vaqt (monotonic)
+known_sheets = {}
+sheet_refreshed_at = {}
+
+# para -> {class_name: (text, parse_mode)}: bugun shu parada haqiqiy darsi bor guruhlar
+reminder_table = {}
+reminder_table_date = None
+# Follower: schedule_cache.updated_at bo'yicha shu paytgacha (baza vaqti) o'zgarganlar xotirada
+synced_until = None
+# Bir vaqtda yozilib, kechroq commit qilingan qatorlar o'tkazib yuborilmasligi uchun
+SYNC_OVERLAP = timedelta(seconds=60)
+# Ishga tushishda xotira keshi fonda to'ldiriladi; shu vaqtda javoblar bazadan o'qiladi
+warm_up_task = None
+background_tasks = set()  # warm-up va fondagi refresh'lar (GC yig'ib olmasligi uchun)
+
+def get_api_base_url():
+    # Read API base URL from environment, default to http://api:8000
+    return os.getenv("API_BASE_URL", "http://api:8000")
+
+def parse_spreadsheet_id(url):
+    """Extract the spreadsheet id from a docs.google.com URL, or None"""
+    try:
+        return url.split('/')[5]
+    except IndexError:
+        print(f"Noto'g'ri URL formati: {url}")
+        return None
+
+def schedule_etag(data):
+    """Must produce the same value as nmadur_api.schedule_etag for the same JSON"""
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return '"' + hashlib.sha1(canonical.encode("utf-8")).hexdigest() + '"'
+
+async def upsert_schedule_cache(db, rows):
+    """Write [{class_name, schedule_date, data, etag}, ...] with one INSERT ... ON CONFLICT.
+
+    Rows whose stored etag already matches are left untouched. Returns the set
+    of (class_name, schedule_date) keys that were inserted or changed.
+    """
+    if not rows:
+        return set()
+    stmt = insert(ScheduleCache.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ScheduleCache.class_name, ScheduleCache.schedule_date],
+        set_={"data": stmt.excluded.data, "etag": stmt.excluded.etag, "updated_at": func.now()},
+        where=ScheduleCache.etag.is_distinct_from(stmt.excluded.etag),
+    ).returning(ScheduleCache.class_name, ScheduleCache.schedule_date)
+    return set((await db.execute(stmt, rows)).all())
+
+async def stored_etags(db, class_names, dates):
+    """{(class_name, schedule_date): etag} of the cached rows of these classes and dates"""
+    rows = await db.execute(
+        select(ScheduleCache.class_name, ScheduleCache.schedule_date, ScheduleCache.etag)
+        .where(ScheduleCache.class_name.in_(class_names), ScheduleCache.schedule_date.in_(dates))
+    )
+    return {(class_name, schedule_date): etag for class_name, schedule_date, etag in rows}
+
+async def stored_schedules(db, keys):
+    """{(class_name, schedule_date): lessons} of the given cached rows"""
+    if not keys:
+        return {}
+    rows = await db.execute(
+        select(ScheduleCache.class_name, ScheduleCache.schedule_date, ScheduleCache.data)
+        .where(tuple_(ScheduleCache.class_name, ScheduleCache.schedule_date).in_(list(keys)))
+    )
+    return {(class_name, schedule_date): data for class_name, schedule_date, data in rows}
+
+async def record_changes(db, changes):
+    """Insert [{class_name, schedule_date, para, before, after}, ...] into schedule_changes; returns their ids"""
+    if not changes:
+        return []
+    stmt = insert(ScheduleChange.__table__).returning(ScheduleChange.id)
+    return sorted((await db.execute(stmt, changes)).scalars().all())
+
+async def recipients_by_class(class_names=None, shard=0, shard_count=1):
+    """{class_name: [chat_id, ...]} of every user (or of the given classes) in one query.
+
+    With shard_count > 1 only chats with abs(chat_id) % shard_count == shard are returned.
+    """
+    query = (
+        select(User.class_name, func.array_agg(User.chat_id))
+        .where(User.class_name.isnot(None))
+        .group_by(User.class_name)
+    )
+    if class_names is not None:
+        query = query.where(User.class_name.in_(list(class_names)))
+    if shard_count > 1:
+        query = query.where(func.abs(User.chat_id) % shard_count == shard)
+    async with get_async_db() as db:
+        return dict((await db.execute(query)).all())
+
+async def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        # aiohttp faqat API'ga birinchi so'rovda import qilinadi (ishga tushish tezroq)
+        import aiohttp
+        http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT_SECONDS),
+            connector=aiohttp.TCPConnector(limit=REFRESH_CONCURRENCY, keepalive_timeout=60)
+        )
+    return http_session
+
+async def get_lookup_session():
+    global lookup_session
+    if lookup_session is None or lookup_session.closed:
+        import aiohttp
+        lookup_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=LOOKUP_TIMEOUT_SECONDS),
+            connector=aiohttp.TCPConnector(keepalive_timeout=60)
+        )
+    return lookup_session
+
+async def close_http_session():
+    global http_session, lookup_session
+    for session in (http_session, lookup_session):
+        if session is not None and not session.closed:
+            await session.close()
+    http_session = lookup_session = None
+
+def get_refresh_lock(key):
+    if key not in refresh_locks:
+        refresh_locks[key] = asyncio.Lock()
+    return refresh_locks[key]
+
+async def post_to_api(path, payload, etag=None, revalidate=False):
+    """POST to the schedule API with retries and jittered backoff.
+
+    With revalidate the API does not answer from a copy past its TTL without
+    re-reading the sheet from Google (it still returns that copy if Google fails).
+    Returns (status, data, etag); status is None when every attempt failed.
+    """
+    import aiohttp
+
+    api_endpoint = f"{get_api_base_url()}{path}"
+    label = payload.get('class_name') or payload.get('sheet_name') or path
+    headers = {"If-None-Match": etag} if etag else {}
+    if revalidate:
+        headers["Cache-Control"] = "max-stale=0"
+    for attempt in range(API_MAX_RETRIES + 1):
+        status = "error"
+        started = time.perf_counter()
+        try:
+            async with refresh_semaphore:
+                session = await get_http_session()
+                with span("api.post", path=path, attempt=attempt) as attrs:
+                    headers[REQUEST_ID_HEADER] = current_trace_id()
+                    async with session.post(api_endpoint, json=payload, headers=headers) as resp:
+                        status = attrs["status"] = resp.status
+                        if resp.status == 304:
+                            return 304, None, etag
+                        if resp.status == 200:
+                            return 200, await resp.json(), resp.headers.get("ETag")
+                        error = f"HTTP {resp.status}"
+                        # 4xx (429 dan tashqari) qayta urinish bilan tuzalmaydi
+                        if resp.status < 500 and resp.status != 429:
+                            print(f"API so'rovi xato ({resp.status}): {label}")
+                            return resp.status, None, None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = repr(e)
+        finally:
+            API_REQUEST_SECONDS.labels(path, status).observe(time.perf_counter() - started)
+
+        if attempt < API_MAX_RETRIES:
+            # Full jitter: 0 .. base * 2^attempt
+            await asyncio.sleep(random.uniform(0, API_RETRY_BASE_SECONDS * 2 ** attempt))
+
+    print(f"API fetch error ({label}): {error}, {API_MAX_RETRIES + 1} urinishdan keyin")
+    return None, None, None
+
+def today_date():
+    # Use Asia/Tashkent timezone to get correct day
+    return datetime.now(TASHKENT_TZ).date()
+
+def upcoming_dates():
+    today = today_date()
+    return [today + timedelta(days=i) for i in range(WEEK_AHEAD_DAYS)]
+
+def current_para(now=None):
+    """Para in progress, or the next one today (LESSON_TIMES); None after the last one"""
+    now = now or datetime.now(TASHKENT_TZ)
+    for lesson in LESSON_TIMES:
+        start = datetime.strptime(lesson['start'], "%H:%M")
+        if now.time() < (start + LESSON_DURATION).time():
+            return lesson['para']
+    return None
+
+# --- O'qituvchi va bo'sh xona qidiruvi (API indekslari bo'yicha) ---
+async def lookup_api(path, payload):
+    """POST an interactive lookup to the API: one attempt, LOOKUP_TIMEOUT_SECONDS, outside refresh_semaphore.
+
+    Returns the JSON body, or None on any error (the user can simply ask again).
+    """
+    import aiohttp
+
+    status = "error"
+    started = time.perf_counter()
+    try:
+        session = await get_lookup_session()
+        with span("api.lookup", path=path) as attrs:
+            headers = {REQUEST_ID_HEADER: current_trace_id()}
+            async with session.post(f"{get_api_base_url()}{path}", json=payload, headers=headers) as resp:
+                status = attrs["status"] = resp.status
+                if resp.status == 200:
+                    return await resp.json()
+                print(f"API qidiruvi xato ({resp.status}): {path}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"API qidiruvi xato ({path}): {e!r}")
+    finally:
+        API_REQUEST_SECONDS.labels(path, status).observe(time.perf_counter() - started)
+    return None
+
+async def find_teacher(name, day_name=None):
+    """API /teacher: {"teacher", "lessons", "matches"}, or None if the API did not answer"""
+    return await lookup_api("/teacher", {"name": name, "day_name": day_name})
+
+async def find_free_rooms(day_name, para):
+    """API /rooms/free: {"day", "para", "time", "rooms"}, or None if the API did not answer"""
+    return await lookup_api("/rooms/free", {"day_name": day_name, "para": para})
 
 async def fetch_and_update_cache(class_name: str):
-    async with lock:
-        with get_db() as db:
-            group = db.query(Group).filter(Group.class_name == class_name).first()
-            if not group:
-                print(f"Guruh topilmadi: {class_name}")
-                return
-            spreadsheet_info = db.query(Spreadsheet).filter(Spreadsheet.degree == group.degree).first()
-            if not spreadsheet_info:
-                print(f"Spreadsheet ma'lumoti topilmadi: {group.degree}-kurs")
-                return
-            try:
-                spreadsheet_id = spreadsheet_info.url.split('/')[5]
-                sheet_name = spreadsheet_info.sheet_name or ""
-            except IndexError:
-                print(f"Noto'g'ri URL formati: {spreadsheet_info.url}")
-                return
-
-            # Use Asia/Tashkent timezone to get correct day
-            day_name = datetime.now(TASHKENT_TZ).strftime('%A')
-            payload = {
-                "spreadsheet_id": spreadsheet_id,
-                "sheet_name": sheet_name,
-                "class_name": class_name,
-                "day_name": day_name
-            }
-
-            # Read API base URL from environment, default to http://api:8000
-            api_base_url = os.getenv("API_BASE_URL", "http://api:8000")
-            api_endpoint = f"{api_base_url}/schedule/"
-
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(api_endpoint, json=payload) as resp:
-                        if resp.status != 200:
-                            print(f"API so'rovi xato ({resp.status})")
-                            return
-                        schedule_data = await resp.json()
-            except Exception as e:
-                print(f"API fetch error ({class_name}): {e}")
-                return
-
-            cache_entry = db.query(ScheduleCache).filter(ScheduleCache.class_name == class_name).first()
-            if cache_entry:
-                cache_entry.data = schedule_data
-            else:
-                cache_entry = ScheduleCache(class_name=class_name, data=schedule_data)
-                db.add(cache_entry)
-            db.commit()
-            print(f"Kesh yangilandi: {class_name} uchun {day_name}")
+    """Refresh the week ahead of one class (one /schedule/week call for its sheet)"""
+    async with get_async_db() as db:
+        group = await db.scalar(select(Group).where(Group.class_name == class_name))
+        if not group:
+            print(f"Guruh topilmadi: {class_name}")
+            return "failed"
+        spreadsheet_info = await db.scalar(select(Spreadsheet).where(Spreadsheet.degree == group.degree))
+        if not spreadsheet_info:
+            print(f"Spreadsheet ma'lumoti topilmadi: {group.degree}-kurs")
+            return "failed"
+    spreadsheet_id = parse_spreadsheet_id(spreadsheet_info.url)
+    if not spreadsheet_id:
+        return "failed"
+    return await fetch_and_update_spreadsheet(spreadsheet_id, spreadsheet_info.sheet_name or "", [class_name])
+
+async def fetch_and_update_spreadsheet(spreadsheet_id: str, sheet_name: str, class_names: list):
+    """Refresh the next WEEK_AHEAD_DAYS days of every class of one spreadsheet from a single sheet fetch"""
+    started = time.perf_counter()
+    with span("refresh.sheet", spreadsheet_id=spreadsheet_id, sheet=sheet_name, classes=len(class_names)) as attrs:
+        result = attrs["result"] = await refresh_spreadsheet(spreadsheet_id, sheet_name, class_names)
+    REFRESH_SHEET_SECONDS.labels(spreadsheet_id, sheet_name, result).observe(time.perf_counter() - started)
+    return result
+
+async def refresh_spreadsheet(spreadsheet_id, sheet_name, class_names):
+    sheet_key = (spreadsheet_id, sheet_name)
+    async with get_refresh_lock(sheet_key):
+        payload = {
+            "spreadsheet_id": spreadsheet_id,
+            "sheet_name": sheet_name
+        }
+        previous = week_payloads.get(sheet_key)
+
+        # Refresh o'zgarishlarni darhol ko'rishi kerak: API eski nusxani emas, Google'dan o'qiganini qaytaradi
+        status, week, week_etag = await post_to_api(
+            "/schedule/week", payload, previous[0] if previous else None, revalidate=True
+        )
+        if status == 304:
+            # Jadval o'zgarmagan, lekin yangi kun qo'shilgan bo'lishi mumkin — saqlangan hafta ishlatiladi
+            week = previous[1]
+        elif status != 200:
+            return "failed"
+        sheet_refreshed_at[sheet_key] = time.monotonic()
+
+        # Saqlangan etag'lar bilan solishtirilib, faqat yangi yoki o'zgargan (guruh, sana) qatorlari
+        # bitta INSERT ... ON CONFLICT bilan yoziladi. O'zgargan qatorlarning eski darslari bilan
+        # para bo'yicha farq olinadi va schedule_changes ga yoziladi — hammasi bitta tranzaksiyada.
+        # Sessiya faqat shu yozuv uchun ochiladi (API so'rovi paytida emas).
+        dates = upcoming_dates()
+        rows = []
+        for schedule_date in dates:
+            day_schedules = week.get(schedule_date.strftime('%A'), {})
+            for class_name in class_names:
+                schedule_data = day_schedules.get(class_name, [])
+                rows.append({
+                    "class_name": class_name,
+                    "schedule_date": schedule_date,
+                    "data": schedule_data,
+                    "etag": schedule_etag(schedule_data),
+                })
+        with span("db.write", classes=len(class_names), days=len(dates)) as attrs:
+            async with get_async_db() as db:
+                stored = await stored_etags(db, class_names, dates)
+                rows = [row for row in rows if stored.get((row["class_name"], row["schedule_date"])) != row["etag"]]
+                previous = await stored_schedules(db, [
+                    (row["class_name"], row["schedule_date"]) for row in rows
+                    if (row["class_name"], row["schedule_date"]) in stored
+                ])
+                written = await upsert_schedule_cache(db, rows)
+                changed = {
+                    (row["class_name"], row["schedule_date"]): row["data"]
+                    for row in rows
+                    if (row["class_name"], row["schedule_date"]) in written
+                }
+                # key -> {para: (oldingi darslar, yangi darslar)}; yangi qatorda hammasi "qo'shilgan"
+                diffs = {key: changed_paras(previous.get(key), data) for key, data in changed.items()}
+                change_ids = await record_changes(db, [
+                    {
+                        "class_name": class_name, "schedule_date": schedule_date,
+                        "para": para, "before": before, "after": after,
+                    }
+                    for (class_name, schedule_date), paras in diffs.items() if (class_name, schedule_date) in previous
+                    for para, (before, after) in paras.items()
+                ])
+                await db.commit()
+            attrs["rows"] = len(written)
+            attrs["lessons"] = len(change_ids)
+        REFRESH_ROWS_WRITTEN.labels(spreadsheet_id, sheet_name).inc(len(changed))
+        REFRESH_LESSONS_CHANGED.labels(spreadsheet_id, sheet_name).inc(len(change_ids))
+        memory_cache.update_schedules(changed)
+        if status == 200 and week_etag:
+            week_payloads[sheet_key] = (week_etag, week)
+
+        if not changed:
+            print(f"Jadval o'zgarmagan: {sheet_name}")
+            return "unchanged"
+        print(
+            f"Kesh yangilandi: {sheet_name} ({len(changed)} ta guruh-kun, {len(change_ids)} ta dars o'zgardi, "
+            f"{dates[0]} — {dates[-1]})"
+        )
+        today = today_date()
+        today_paras = {class_name: paras for (class_name, day), paras in diffs.items() if day == today and paras}
+        if today_paras:
+            await adjust_reminders(today_paras)
+        if change_ids and NOTIFY_SCHEDULE_CHANGES:
+            await notify_changes(change_ids)
+        return "updated"
+
+def id_ranges(ids):
+    """Sorted ids -> [[first, last], ...] of consecutive runs (one run per refresh, unless inserts interleaved)"""
+    ranges = []
+    for change_id in ids:
+        if ranges and ranges[-1][1] == change_id - 1:
+            ranges[-1][1] = change_id
+        else:
+            ranges.append([change_id, change_id])
+    return ranges
+
+async def notify_changes(change_ids):
+    """Queue one "schedule changed" message per affected class (sent shard by shard like other deliveries)"""
+    try:
+        await coordination.enqueue_run(
+            "changes", f"changes:{change_ids[0]}-{change_ids[-1]}", {"ids": id_ranges(change_ids)},
+            deadline=datetime.now(TASHKENT_TZ) + CHANGE_SEND_GRACE
+        )
+    except Exception as e:
+        # O'zgarishlar bazada saqlangan; faqat xabar yuborilmaydi
+        print(f"O'zgarish xabarini navbatga qo'yishda xato: {e}")
+
+async def load_sheets():
+    """Group class names by spreadsheet: {(spreadsheet_id, sheet_name): [class_name, ...]}"""
+    async with get_async_db() as db:
+        rows = (await db.execute(
+            select(Group.degree, Group.class_name, Spreadsheet.url, Spreadsheet.sheet_name)
+            .join(Spreadsheet, Spreadsheet.degree == Group.degree)
+            .order_by(Group.id)
+        )).all()
+    memory_cache.set_groups((degree, class_name) for degree, class_name, _, _ in rows)
+
+    sheets = {}
+    for _, class_name, url, sheet_name in rows:
+        spreadsheet_id = parse_spreadsheet_id(url)
+        if not spreadsheet_id:
+            continue
+        sheets.setdefault((spreadsheet_id, sheet_name or ""), []).append(class_name)
+    known_sheets.clear()
+    known_sheets.update(sheets)
+    return sheets
 
 async def refresh_all_cache():
-    with get_db() as db:
-        class_names = [r[0] for r in db.query(Group.class_name).distinct().all()]
-    await asyncio.gather(*(fetch_and_update_cache(c) for c in class_names))
+    started = time.monotonic()
+    # Bitta trace: har bir jadval, uning API so'rovi va DB yozuvi shu id bilan log qilinadi
+    with span("refresh.run", root=True) as attrs:
+        # Har bir jadval uchun bitta so'rov
+        sheets = await load_sheets()
 
-async def send_lesson_reminder(class_name: str, para_number: int):
-    if not application:
+        results = await asyncio.gather(*(
+            fetch_and_update_spreadsheet(spreadsheet_id, sheet_name, class_names)
+            for (spreadsheet_id, sheet_name), class_names in sheets.items()
+        ))
+
+        await schedule_daily_notifications()
+        attrs["sheets"] = len(sheets)
+
+    duration = time.monotonic() - started
+    REFRESH_RUN_SECONDS.observe(duration)
+    classes = sum(len(class_names) for class_names in sheets.values())
+    summary = {status: results.count(status) for status in ("updated", "unchanged", "failed")}
+    print(
+        f"Kesh yangilash tugadi: {len(sheets)} ta jadval, {classes} ta guruh, "
+        f"{summary} — {duration:.2f} s"
+    )
+    return {"sheets": len(sheets), "classes": classes, "duration_seconds": round(duration, 3), **summary}
+
+async def revalidate_stalest_sheet():
+    """Background refresher tick: revalidate at most one sheet older than REFRESH_INTERVAL_MINUTES.
+
+    Ticks are REVALIDATE_TICK_SECONDS apart, so sheet fetches are spread across
+    the day instead of all happening at once.
+    """
+    if not known_sheets:
+        await load_sheets()
+    if not known_sheets:
         return
-    with get_db() as db:
-        cache_entry = db.query(ScheduleCache).filter(ScheduleCache.class_name == class_name).first()
-        if not cache_entry or not cache_entry.data:
-            return
-        lesson = next((l for l in cache_entry.data if str(l.get('para')) == str(para_number)), None)
-        if not lesson or lesson.get('subject') in ['Bo\'sh', 'Bo\'sh kun']:
-            return
-        reminder_text = (
-            f"🔔 **ESLATMA (10 daqiqadan so'ng): {class_name}**\n\n"
-            f"🔸 **{lesson.get('para', 'N/A')}**-juft: **{lesson.get('time', 'N/A')}**\n"
-            f"📚 Fan: **{lesson.get('subject', 'N/A')}**\n"
-            f"🚪 Xona: {lesson.get('room', 'N/A')}\n"
-            f"👤 O'qituvchi: {lesson.get('teacher', 'N/A')}"
+    sheet_key = min(known_sheets, key=lambda key: sheet_refreshed_at.get(key, 0.0))
+    if time.monotonic() - sheet_refreshed_at.get(sheet_key, 0.0) < REFRESH_INTERVAL_MINUTES * 60:
+        return
+    await fetch_and_update_spreadsheet(sheet_key[0], sheet_key[1], known_sheets[sheet_key])
+
+async def flip_to_today():
+    """06:00: drop past days, then refresh every sheet so the newly uncovered last day is filled.
+
+    Runs whatever REFRESH_INTERVAL_MINUTES is: with 0 this is the only refresh
+    after startup. Unchanged sheets cost a 304 (the stored week fills the new day).
+    """
+    today = today_date()
+    memory_cache.prune(today)
+    async with get_async_db() as db:
+        await db.execute(delete(ScheduleCache).where(ScheduleCache.schedule_date < today))
+        await db.execute(delete(ScheduleChange).where(ScheduleChange.schedule_date < today))
+        await db.commit()
+    print(f"Bugungi kun: {today}")
+    try:
+        # refresh_all_cache bugungi eslatmalarni ham qayta hisoblaydi
+        await refresh_all_cache()
+    except Exception as e:
+        print(f"Keshni yangilashda xato: {e}")
+        await schedule_daily_notifications()
+
+async def sync_from_db():
+    """Follower replicas: pull the schedule_cache rows the leader changed since the last sync.
+
+    The leader's own refreshes update its memory directly; here other replicas
+    keep their button views and delivery texts current.
+    """
+    global synced_until
+    if warm_up_task is not None and not warm_up_task.done():
+        # Warm-up tugamaguncha o'tkazib yuboriladi: aks holda u yangi qatorlarni eskisi bilan almashtirishi mumkin
+        return
+    today = today_date()
+    async with get_async_db() as db:
+        now = await db.scalar(select(func.now()))
+        query = (
+            select(ScheduleCache.class_name, ScheduleCache.schedule_date, ScheduleCache.data)
+            .where(ScheduleCache.schedule_date >= today)
         )
-        user_chat_ids = db.query(User.chat_id).filter(User.class_name == class_name).all()
-        for (chat_id,) in user_chat_ids:
-            try:
-                await application.bot.send_message(chat_id=chat_id, text=reminder_text, parse_mode='Markdown')
-            except Exception as e:
-                print(f"Eslatma yuborishda xato ({chat_id}): {e}")
+        if synced_until is not None:
+            query = query.where(ScheduleCache.updated_at > synced_until - SYNC_OVERLAP)
+        rows = (await db.execute(query)).all()
+    synced_until = now
+    changed = {
+        (class_name, day): data
+        for class_name, day, data in rows
+        if not memory_cache.holds((class_name, day), data)
+    }
+    # Bugungi eslatmalar faqat o'zgargan paralar uchun yangilanadi (xotirada eski jadval bo'lmasa — hammasi)
+    today_paras = {}
+    for (class_name, day), data in changed.items():
+        if day != today:
+            continue
+        cached, old = memory_cache.peek((class_name, day))
+        today_paras[class_name] = changed_paras(old, data) if cached else [lesson['para'] for lesson in LESSON_TIMES]
+    memory_cache.update_schedules(changed)
+    if any(today_paras.values()):
+        await adjust_reminders(today_paras)
+
+async def load_memory_cache():
+    """Startup: fill the memory cache from the database and start the follower sync watermark there"""
+    global synced_until
+    async with get_async_db() as db:
+        synced_until = await db.scalar(select(func.now()))
+    await memory_cache.load_from_db(today_date())
+
+def start_warm_up():
+    """Startup: load the memory cache in the background. Until it is done the
+    handlers read through to the database, so the bot can answer right away."""
+    global warm_up_task
+    warm_up_task = run_in_background(warm_up_memory_cache())
+    return warm_up_task
+
+async def warm_up_memory_cache():
+    try:
+        await load_memory_cache()
+    except Exception as e:
+        print(f"Xotira keshini yuklashda xato: {e}")
+
+async def refresh_after_warm_up():
+    """Leader's startup refresh; waits for the warm-up so it cannot overwrite fresher rows"""
+    if warm_up_task is not None:
+        await warm_up_task
+    # aiohttp importi ~0.2 s: thread'da bo'lsa event loop shu vaqtda ham update'larga javob beradi
+    await asyncio.to_thread(importlib.import_module, "aiohttp")
+    try:
+        await refresh_all_cache()
+    except Exception as e:
+        print(f"Keshni yangilashda xato: {e}")
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def stop_background_tasks():
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def reminder_messages(args, shard=0, shard_count=1):
+    """(label, messages) of one para's reminders for one chat_id shard"""
+    para_number = args["para"]
+    if not coordination.is_leader():
+        await sync_from_db()
+    if reminder_table_date != today_date():
+        # Bu nusxada bugungi jadval hali qurilmagan (follower yoki 06:02 dan oldin)
+        await schedule_daily_notifications()
+    texts = reminder_table.get(para_number) or {}
+    recipients = await recipients_by_class(texts, shard, shard_count) if texts else {}
+    messages = [
+        (chat_id, *texts[class_name])
+        for class_name, chat_ids in recipients.items() for chat_id in chat_ids
+    ]
+    return f"Eslatma {para_number}-para ({len(texts)} ta guruh)", messages
+
+async def daily_messages(args=None, shard=0, shard_count=1):
+    """(label, messages) of today's schedule for one chat_id shard (all chats by default)"""
+    if not coordination.is_leader():
+        await sync_from_db()
+    today = today_date()
+    day_name = today.strftime('%A')
+    recipients = await recipients_by_class(shard=shard, shard_count=shard_count)
+
+    # Matnlar refresh paytida tayyorlangan — bu yerda har bir guruh uchun bir marta qidiriladi
+    outgoing = []
+    for class_name, chat_ids in recipients.items():
+        messages = await memory_cache.get_messages(class_name, today)
+        text, parse_mode = messages["daily"] if messages else (NO_LESSONS_TEXT, None)
+        outgoing.extend((chat_id, text, parse_mode) for chat_id in chat_ids)
+    return f"Kunlik jadval {day_name}", outgoing
+
+async def change_messages(args, shard=0, shard_count=1):
+    """(label, messages) of the "schedule changed" notices of one refresh for one chat_id shard"""
+    async with get_async_db() as db:
+        rows = (await db.execute(
+            select(
+                ScheduleChange.class_name, ScheduleChange.schedule_date, ScheduleChange.para,
+                ScheduleChange.before, ScheduleChange.after
+            )
+            .where(or_(*(ScheduleChange.id.between(first, last) for first, last in args["ids"])))
+        )).all()
+    changes = {}
+    for class_name, schedule_date, para, before, after in rows:
+        changes.setdefault(class_name, []).append((schedule_date, para, before or [], after or []))
+    texts = {class_name: render_changes(class_name, class_changes) for class_name, class_changes in changes.items()}
+    recipients = await recipients_by_class(texts, shard, shard_count) if texts else {}
+    messages = [
+        (chat_id, *texts[class_name])
+        for class_name, chat_ids in recipients.items() for chat_id in chat_ids
+    ]
+    return f"Jadval o'zgarishi ({len(texts)} ta guruh)", messages
+
+coordination.register_executor("reminder", reminder_messages)
+coordination.register_executor("daily", daily_messages)
+coordination.register_executor("changes", change_messages)
 
 async def send_daily_schedule():
-    """Send daily schedule to all users at 06:01 Asia/Tashkent"""
+    """Send today's schedule to all users from this replica in one broadcast (no sharding).
+
+    Scheduled runs go through daily_schedule_job instead; this is the direct path.
+    """
+    if not application:
+        return
+    label, outgoing = await daily_messages()
+    print(f"{label} yuborilmoqda")
+    return await broadcast(application.bot, outgoing, label=label, kind="daily")
+
+async def send_para_reminders(para_number: int):
+    """Remind every class that has a real lesson in this para, in one broadcast from this replica"""
     if not application:
         return
+    label, outgoing = await reminder_messages({"para": para_number})
+    if not outgoing:
+        return
+    return await broadcast(application.bot, outgoing, label=label, kind="reminder")
+
+async def para_reminder_job(para_number: int):
+    """Leader job: queue this para's reminders; replicas send them shard by shard until shortly after the lesson starts"""
+    today = today_date()
+    lesson = next(lesson for lesson in LESSON_TIMES if lesson["para"] == para_number)
+    starts_at = datetime.combine(today, datetime.strptime(lesson["start"], "%H:%M").time(), TASHKENT_TZ)
+    await coordination.enqueue_run("reminder", f"reminder:{today}:{para_number}", {"para": para_number}, deadline=starts_at + REMINDER_SEND_GRACE)
+
+async def daily_schedule_job():
+    """Leader job (06:01 Asia/Tashkent): queue today's schedule for every user"""
+    today = today_date()
+    await coordination.enqueue_run("daily", f"daily:{today}", deadline=datetime.now(TASHKENT_TZ) + DAILY_SEND_GRACE)
+
+async def schedule_daily_notifications():
+    """Rebuild today's para -> {class_name: (text, parse_mode)} reminder table from the rendered messages"""
+    global reminder_table, reminder_table_date
+    today = today_date()
+    table = {lesson['para']: {} for lesson in LESSON_TIMES}
+    for class_name in await memory_cache.all_class_names():
+        for kind, message in (await memory_cache.get_messages(class_name, today) or {}).items():
+            if kind != "daily" and kind[1] in table:
+                table[kind[1]][class_name] = message
+    reminder_table = table
+    reminder_table_date = today
+    print(f"Eslatmalar jadvali yangilandi: {sum(len(c) for c in table.values())} ta dars")
+
+async def adjust_reminders(class_paras):
+    """Update today's reminder table for the changed paras only: {class_name: [para, ...]}.
+
+    Entries of other paras and classes are left as they are; the whole table
+    is rebuilt only when it is not today's yet.
+    """
+    today = today_date()
+    if reminder_table_date != today:
+        await schedule_daily_notifications()
+        return
+    updated = 0
+    for class_name, paras in class_paras.items():
+        messages = await memory_cache.get_messages(class_name, today) or {}
+        for para in paras:
+            if para not in reminder_table:
+                continue
+            message = messages.get(("reminder", para))
+            if message:
+                reminder_table[para][class_name] = message
+            else:
+                reminder_table[para].pop(class_name, None)
+            updated += 1
+    print(f"Eslatmalar yangilandi: {len(class_paras)} ta guruh, {updated} ta para")
+
+def ensure_job(job_id, func, trigger, args=None, **options):
+    """Add or update a persisted job. If the stored job has the same trigger its next
+    run time is kept, so a run missed while no leader was up still fires (within
+    misfire_grace_time) instead of being rescheduled from now."""
+    job = scheduler.get_job(job_id)
+    if job is not None and str(job.trigger) == str(trigger):
+        job.modify(func=func, args=args or [], **options)
+    else:
+        scheduler.add_job(func, trigger, args=args, id=job_id, replace_existing=True, **options)
 
-    await refresh_all_cache()
-    
-    day_name = datetime.now(TASHKENT_TZ).strftime('%A')
-    print(f"Kunlik jadval yuborilmoqda: {day_name}")
-    
-    with get_db() as db:
-        users = db.query(User).filter(User.class_name.isnot(None)).all()
-        
-        for user in users:
-            try:
-                cache_entry = db.query(ScheduleCache).filter(
-                    ScheduleCache.class_name == user.class_name
-                ).first()
-                
-                # Check if cache exists and has data
-                if not cache_entry or not cache_entry.data:
-                    # No cache - send "no lessons" message
-                    await application.bot.send_message(
-                        chat_id=user.chat_id,
-                        text="Bugun sizda dars mavjud emas"
-                    )
-                    continue
-                
-                schedule_data = cache_entry.data
-                
-                # Check if schedule has real lessons
-                if not has_real_lessons(schedule_data):
-                    # No real lessons - send exact message
-                    await application.bot.send_message(
-                        chat_id=user.chat_id,
-                        text="Bugun sizda dars mavjud emas"
-                    )
-                else:
-                    # Format and send schedule
-                    output = [f"📅 **Bugungi jadval ({day_name})** uchun **{user.class_name}**:\n"]
-                    for item in schedule_data:
-                        subject = item.get('subject', 'N/A')
-                        # Skip empty slots in the output
-                        if subject in ['Bo\'sh', 'Bo\'sh kun']:
-                            continue
-                        output.append(
-                            f"🔸 **{item.get('para', 'N/A')}**-para: **{item.get('time', 'N/A')}**\n"
-                            f"📚 {subject} ({item.get('room', 'N/A')})\n"
-                            f"👤 O'qituvchi: {item.get('teacher', 'N/A')}\n"
-                            "---"
-                        )
-                    
-                    message_text = "\n".join(output)
-                    await application.bot.send_message(
-                        chat_id=user.chat_id,
-                        text=message_text,
-                        parse_mode='Markdown'
-                    )
-            except Exception as e:
-                print(f"Kunlik jadval yuborishda xato ({user.chat_id}): {e}")
-    
-    print(f"Kunlik jadval yuborildi: {day_name}")
-
-def schedule_daily_notifications():
-    scheduler.remove_all_jobs(jobstore='default')
-
-    with get_db() as db:
-        class_names = [r[0] for r in db.query(Group.class_name).distinct().all()]
-    # Use Asia/Tashkent timezone for date string
-    today = datetime.now(TASHKENT_TZ).strftime('%Y-%m-%d')
+def schedule_reminder_jobs():
+    """One cron job per lesson slot; each fans out to all classes with a lesson in it"""
     for lesson in LESSON_TIMES:
         # Parse lesson time and calculate reminder time
         # Note: times are already in Asia/Tashkent as scheduler uses TASHKENT_TZ
         start_time = datetime.strptime(lesson['start'], "%H:%M")
         reminder_time = start_time - timedelta(minutes=REMINDER_OFFSET_MINUTES)
-        for class_name in class_names:
-            job_id = f"reminder_{class_name}_{lesson['para']}_{today}"
-            scheduler.add_job(
-                send_lesson_reminder,
-                'cron',
-                hour=reminder_time.hour,
-                minute=reminder_time.minute,
-                args=[class_name, lesson['para']],
-                id=job_id,
-                misfire_grace_time=60,
-                max_instances=1,
-                replace_existing=True
-            )
+        ensure_job(
+            f"reminder_para_{lesson['para']}",
+            para_reminder_job,
+            CronTrigger(hour=reminder_time.hour, minute=reminder_time.minute, timezone=TASHKENT_TZ),
+            args=[lesson['para']],
+            misfire_grace_time=60,
+            max_instances=1,
+            coalesce=True
+        )
+
+def start_scheduler(loop):
+    """Run the scheduler on this replica (called when it becomes leader, in a worker thread:
+    reconciling jobs reads and writes the job store).
+
+    The first time it starts paused, so persisted jobs can be reconciled
+    before anything fires; after a demotion it is only resumed. Jobs run on loop.
+    """
+    job_executor.loop = loop
+    if scheduler.running:
+        scheduler.resume()
+        print("✅ Scheduler davom ettirildi")
+        return
 
-def start_scheduler():
-    # 06:00 — Keshni yangilash
-    scheduler.add_job(
-        refresh_all_cache,
-        trigger='cron',
-        hour=6,
-        minute=0,
-        id='cache_refresh',
-        replace_existing=True,
+    observe_scheduler(scheduler)
+    scheduler.start(paused=True)
+
+    # 06:00 — Bugungi kunga o'tish (hafta oldindan keshda)
+    ensure_job(
+        'cache_refresh',
+        flip_to_today,
+        CronTrigger(hour=6, minute=0, timezone=TASHKENT_TZ),
         coalesce=True,
         misfire_grace_time=300
     )
 
-    # 06:01 — Kunlik jadval yuborish
-    scheduler.add_job(
-        send_daily_schedule,
-        trigger='cron',
-        hour=6,
-        minute=1,
-        id='daily_schedule',
-        replace_existing=True,
+    # Kun davomida — jadvallarni birma-bir, navbat bilan tekshirish (o'zgarmaganlari 304 bilan qaytadi)
+    if REFRESH_INTERVAL_MINUTES > 0:
+        ensure_job(
+            'cache_revalidate',
+            revalidate_stalest_sheet,
+            IntervalTrigger(seconds=REVALIDATE_TICK_SECONDS, timezone=TASHKENT_TZ),
+            coalesce=True,
+            max_instances=1
+        )
+    elif scheduler.get_job('cache_revalidate'):
+        scheduler.remove_job('cache_revalidate')
+
+    # 06:01 — Kunlik jadval navbatga qo'yiladi (yuborishni barcha nusxalar bo'lib oladi)
+    ensure_job(
+        'daily_schedule',
+        daily_schedule_job,
+        CronTrigger(hour=6, minute=1, timezone=TASHKENT_TZ),
         coalesce=True,
-        misfire_grace_time=300
+        misfire_grace_time=int(DAILY_SEND_GRACE.total_seconds())
     )
 
-    # 06:02 — Reminder’larni rejalashtirish
-    scheduler.add_job(
+    # 06:02 — Bugungi eslatmalar jadvalini qayta hisoblash
+    ensure_job(
+        'schedule_reminders',
         schedule_daily_notifications,
-        trigger='cron',
-        hour=6,
-        minute=2,
-        id='schedule_reminders',
-        replace_existing=True,
+        CronTrigger(hour=6, minute=2, timezone=TASHKENT_TZ),
         coalesce=True,
         misfire_grace_time=300
     )
 
-    scheduler.start()
+    # Har bir para uchun bitta eslatma job'i
+    schedule_reminder_jobs()
+
+    scheduler.resume()
     print("✅ Scheduler ishonchli tarzda ishga tushirildi (Asia/Tashkent)")
+
+def pause_scheduler():
+    """Lost the leader lock: stop firing jobs (the new leader owns them now)"""
+    if scheduler.running:
+        scheduler.pause()
+        print("⏸ Scheduler to'xtatildi (lider emas)")
+
+async def stop_scheduler():
+    """Shutdown: stop the scheduler thread before the event loop closes"""
+    if scheduler.running:
+        await asyncio.to_thread(scheduler.shutdown, wait=False)
+
+async def on_elected():
+    await asyncio.to_thread(start_scheduler, asyncio.get_running_loop())
+    # Yangilash fonda: shu vaqtda bot bazadagi oxirgi kesh bilan javob beradi
+    run_in_background(refresh_after_warm_up())
+
+async def on_demoted():
+    pause_scheduler()
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import os
+import signal
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from telegram import Update
+
+# --- Webhook parametrlari ---
+# WEBHOOK_URL — Telegram yuboradigan tashqi manzil (masalan https://bot.example.com).
+# Bo'sh bo'lsa setWebhook chaqirilmaydi: lokal test uchun Update JSON'ni o'zingiz POST qilasiz.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# To'xtashda ishlov berilayotgan so'rovlar uchun kutish vaqti (sekund)
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", 30))
+
+
+def build_web_app(application):
+    """aiohttp app that feeds Telegram updates into the PTB update queue."""
+
+    async def receive_update(request):
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        if not application.running:
+            return web.Response(status=503)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logging.error(f"Noto'g'ri update: {e}")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def health_check(request):
+        return web.json_response({
+            "status": "ok" if application.running else "stopping",
+            "pending_updates": application.update_queue.qsize(),
+        })
+
+    async def metrics(request):
+        return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    web_app = web.Application()
+    web_app.router.add_post(WEBHOOK_PATH, receive_update)
+    web_app.router.add_get("/healthz", health_check)
+    web_app.router.add_get("/metrics", metrics)
+    return web_app
+
+
+async def run_webhook(application):
+    """Serve updates over HTTP until SIGINT/SIGTERM, then drain in-flight handlers."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    runner = web.AppRunner(build_web_app(application), shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    await site.start()
+
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True,
+        )
+    logging.info(f"🌐 Webhook {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH} da tinglayapti")
+
+    try:
+        await stop_event.wait()
+    finally:
+        logging.info("⏳ Webhook to'xtatilmoqda: navbatdagi update'lar tugatiladi...")
+        # 1) yangi so'rov qabul qilinmaydi, ochiq so'rovlar tugashi kutiladi
+        await runner.cleanup()
+        # 2) navbatdagi va ishlov berilayotgan update'lar tugaguncha kutiladi
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logging.info("✅ Webhook to'xtadi")
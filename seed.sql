@@ -18,6 +18,10 @@ CREATE TABLE IF NOT EXISTS spreadsheets (
     sheet_name VARCHAR
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS ix_groups_class_name ON groups (class_name);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_chat_id ON users (chat_id);
+CREATE INDEX IF NOT EXISTS ix_users_class_name ON users (class_name);
+
 -- 2. INSERT INTO groups
 INSERT INTO groups (id, degree, class_name) VALUES
 (1, 4, '22-302 SW'),